@@ -0,0 +1,400 @@
+# analysis.py
+"""오디오 다운로드 + 코드 분석 파이프라인 (Flask 앱 / 분석 워커 공용)"""
+import os
+# librosa 의 numba JIT 결과를 재시작/재배포 후에도 재사용하도록 고정 위치에 캐시
+# (numba 를 import 하기 전에 설정해야 함)
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".numba_cache"))
+import yt_dlp
+import uuid
+import time
+import tempfile
+import soundfile as sf
+import librosa
+import numpy as np
+import math
+import logging
+from pathlib import Path
+from scipy.ndimage import gaussian_filter1d
+from song_vectors import build_feature_vector
+from metadata import valid_video_id
+from versions import PIPELINE_VERSION, FEATURE_VERSION
+
+# 기타 코드 차트 데이터
+CHORD_CHARTS = {
+    'A':   {'chord': 'A',   'frets': [0, 0, 2, 2, 2, 0], 'fingers': [0, 0, 1, 2, 3, 0]},
+    'A#':  {'chord': 'A#',  'frets': [1, 1, 3, 3, 3, 1], 'fingers': [1, 1, 2, 3, 4, 1]},
+    'A#m': {'chord': 'A#m', 'frets': [1, 1, 3, 3, 2, 1], 'fingers': [1, 1, 3, 4, 2, 1]},
+    'Am':  {'chord': 'Am',  'frets': [0, 0, 2, 2, 1, 0], 'fingers': [0, 0, 2, 3, 1, 0]},
+    'B':   {'chord': 'B',   'frets': [2, 2, 4, 4, 4, 2], 'fingers': [1, 1, 2, 3, 4, 1]},
+    'Bb':  {'chord': 'Bb',  'frets': [1, 1, 3, 3, 3, 1], 'fingers': [1, 1, 2, 3, 4, 1]},
+    'Bm':  {'chord': 'Bm',  'frets': [2, 2, 4, 4, 3, 2], 'fingers': [1, 1, 3, 4, 2, 1]},
+    'C':   {'chord': 'C',   'frets': [0, 3, 2, 0, 1, 0], 'fingers': [0, 3, 2, 0, 1, 0]},
+    'C#':  {'chord': 'C#',  'frets': [-1, 4, 6, 6, 6, 4], 'fingers': [0, 1, 3, 4, 2, 1]},
+    'C#m': {'chord': 'C#m', 'frets': [4, 4, 6, 6, 5, 4], 'fingers': [1, 1, 3, 4, 2, 1]},
+    'Cm':  {'chord': 'Cm',  'frets': [-1, 3, 5, 5, 4, 3], 'fingers': [0, 1, 3, 4, 2, 1]},
+    'D':   {'chord': 'D',   'frets': [-1, 0, 0, 2, 3, 2], 'fingers': [0, 0, 0, 1, 3, 2]},
+    'D#':  {'chord': 'D#',  'frets': [-1, 6, 8, 8, 8, 6], 'fingers': [0, 1, 3, 4, 2, 1]},
+    'D#m': {'chord': 'D#m', 'frets': [-1, 6, 8, 8, 7, 6], 'fingers': [0, 1, 3, 4, 2, 1]},
+    'Dm':  {'chord': 'Dm',  'frets': [-1, 0, 0, 2, 3, 1], 'fingers': [0, 0, 0, 2, 3, 1]},
+    'E':   {'chord': 'E',   'frets': [0, 2, 2, 1, 0, 0], 'fingers': [0, 2, 3, 1, 0, 0]},
+    'Em':  {'chord': 'Em',  'frets': [0, 2, 2, 0, 0, 0], 'fingers': [0, 1, 2, 0, 0, 0]},
+    'F':   {'chord': 'F',   'frets': [1, 3, 3, 2, 1, 1], 'fingers': [1, 3, 4, 2, 1, 1]},
+    'F#':  {'chord': 'F#',  'frets': [2, 4, 4, 3, 2, 2], 'fingers': [1, 3, 4, 2, 1, 1]},
+    'Fm':  {'chord': 'Fm',  'frets': [1, 3, 3, 1, 1, 1], 'fingers': [1, 3, 4, 1, 1, 1]},
+    'F#m': {'chord': 'F#m', 'frets': [2, 4, 4, 2, 2, 2], 'fingers': [1, 3, 4, 1, 1, 1]},
+    'G':   {'chord': 'G',   'frets': [3, 2, 0, 0, 3, 3], 'fingers': [3, 1, 0, 0, 4, 4]},
+    'G#':  {'chord': 'G#',  'frets': [4, 6, 6, 5, 4, 4], 'fingers': [1, 3, 4, 2, 1, 1]},
+    'G#m': {'chord': 'G#m', 'frets': [4, 6, 6, 4, 4, 4], 'fingers': [1, 3, 4, 1, 1, 1]},
+    'Gm':  {'chord': 'Gm',  'frets': [3, 3, 5, 5, 3, 3], 'fingers': [1, 1, 3, 4, 1, 1]},
+}
+
+KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# ---- 추가: 코드 템플릿/디코딩 유틸 ----
+MAJOR = np.array([0, 4, 7])
+MINOR = np.array([0, 3, 7])
+
+
+def build_chord_templates():
+    """24개(12메이저+12마이너) 코드 템플릿 반환"""
+    names = []
+    mats = []
+    for i, root in enumerate(KEYS):
+        vecM = np.zeros(12)
+        vecM[(i + MAJOR) % 12] = 1
+        vecm = np.zeros(12)
+        vecm[(i + MINOR) % 12] = 1
+        mats.append(vecM / vecM.sum())
+        names.append(root)
+        mats.append(vecm / vecm.sum())
+        names.append(root + "m")
+    return names, np.array(mats, dtype=float)
+
+
+def viterbi_decode(score_matrix, switch_penalty=0.2):
+    """
+    score_matrix: (T, N)  값이 클수록 그 코드일 확률이 높다고 봄
+    switch_penalty: 코드가 바뀔 때 패널티
+    """
+    T, N = score_matrix.shape
+    dp = np.zeros((T, N), dtype=float)
+    back = np.zeros((T, N), dtype=int)
+
+    dp[0] = score_matrix[0]
+    for t in range(1, T):
+        # 이전 상태 값에 패널티 적용
+        trans = dp[t-1][:, None] - switch_penalty
+        stay_or_switch = np.maximum(
+            trans.max(axis=0), dp[t-1])  # stay vs switch
+        best_prev = np.argmax(trans, axis=0)
+        dp[t] = score_matrix[t] + stay_or_switch
+        back[t] = np.where(dp[t-1] >= trans.max(axis=0),
+                           np.arange(N), best_prev)
+
+    path = np.zeros(T, dtype=int)
+    path[-1] = np.argmax(dp[-1])
+    for t in range(T-2, -1, -1):
+        path[t] = back[t+1, path[t+1]]
+    return path
+
+
+def merge_segments(idx_path, chord_names, times, min_dur=0.5):
+    """프레임별 인덱스를 타임라인으로 병합"""
+    segs = []
+    start = 0
+    cur = idx_path[0]
+    limit = min(len(idx_path), len(times))  # 인덱스 초과 방지
+
+    for i in range(1, limit):
+        if idx_path[i] != cur:
+            if i >= len(times) or start >= len(times):
+                continue  # 안전하게 스킵
+            dur = float(times[i] - times[start])
+            if dur >= min_dur:
+                segs.append({
+                    "chord": chord_names[cur],
+                    "timestamp": float(times[start]),
+                    "duration": dur
+                })
+            start = i
+            cur = idx_path[i]
+
+    # 마지막 세그먼트 처리
+    if start < len(times) and (limit - 1) < len(times):
+        dur = float(times[limit - 1] - times[start])
+        if dur >= min_dur:
+            segs.append({
+                "chord": chord_names[cur],
+                "timestamp": float(times[start]),
+                "duration": dur
+            })
+    return segs
+
+
+def estimate_key_from_chords(chords):
+    """추출된 코드들의 루트 다수결로 키 추정(간단버전)"""
+    roots = [c.replace("m", "") for c in chords]
+    if not roots:
+        return "C"
+    return max(set(roots), key=roots.count)
+# ---- /추가 ----
+
+
+def download_audio_from_youtube(video_url: str, out_dir: str) -> str:
+    tmp_id = uuid.uuid4().hex
+    out_tmpl = os.path.join(out_dir, f"{tmp_id}.%(ext)s")
+
+    ydl_opts = {
+        "format": "bestaudio/best",
+        "outtmpl": out_tmpl,
+        "noplaylist": True,
+        "quiet": True,
+        "postprocessors": [{
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": "mp3",
+            "preferredquality": "192",
+        }],
+        "extractor_args": {"youtube": {"player_client": ["android"]}},
+        "http_headers": {"User-Agent": "Mozilla/5.0"},
+        # ↓ 디버깅용 옵션(필요시 켜기)
+        # "verbose": True,
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(video_url, download=True)
+        pre_path = ydl.prepare_filename(info)
+        final_path = str(Path(pre_path).with_suffix(".mp3"))
+
+    # 혹시 mp3가 다른 이름으로 생겼는지 확인
+    if not os.path.exists(final_path):
+        candidates = list(Path(out_dir).glob(f"{tmp_id}*.mp3"))
+        if candidates:
+            final_path = str(candidates[0])
+
+    size = os.path.getsize(final_path) if os.path.exists(final_path) else 0
+    logging.info(f"[yt-dlp] saved: {final_path} ({size/1024:.1f} KB)")
+
+    if size < 50_000:  # 50KB 미만이면 실패로 판단
+        raise ValueError("Downloaded audio seems invalid/too small.")
+
+    return final_path
+
+
+def safe_load_audio(path, duration=60):
+    if not os.path.exists(path) or os.path.getsize(path) < 2048:
+        raise ValueError("Audio file missing or too small.")
+    y, sr = librosa.load(path, mono=True, duration=duration)
+    if y.size == 0:
+        raise ValueError("Empty audio array.")
+    return y, sr
+
+
+def safe_tempo(y, sr):
+    try:
+        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+        return 120 if (tempo is None or np.isnan(tempo) or tempo == 0) else float(tempo)
+    except Exception:
+        return 120
+
+
+def safe_key(y, sr):
+    try:
+        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+        prof = np.mean(chroma, axis=1)
+        idx = int(np.argmax(prof))
+        return KEYS[idx]
+    except Exception:
+        return 'C'
+
+
+# ---- 튜닝 값 ----
+# 아래 디코딩 값(템플릿, 평활화, Viterbi, 병합)을 바꾸면 versions.PIPELINE_VERSION 을 올린다.
+SMOOTH_SIGMA = 1.0
+SWITCH_PENALTY = 0.15
+MIN_SEGMENT_DUR = 0.5
+
+# 특징 추출 단계(HPSS, 비트, 크로마)를 바꾸면 versions.FEATURE_VERSION 을 올린다 (캐시 무효화)
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "features")
+
+
+def extract_features(y, sr):
+    """무거운 단계: 하모닉 분리, 비트 트래킹, 비트 싱크 크로마 → 디코딩 입력"""
+    # ───── RMS 정규화 (볼륨 편차 줄이기) ─────
+    y = y / (np.sqrt(np.mean(y**2)) + 1e-6)
+
+    # 1) 하모닉/퍼커시브 분리 → 하모닉만 사용
+    y_h, _ = librosa.effects.hpss(y)
+
+    # 2) 비트 트래킹
+    tempo_raw, beat_frames = librosa.beat.beat_track(y=y_h, sr=sr)
+
+    # tempo를 확실히 float로 변환
+    # round, float 변환
+    tempo_val = float(np.asarray(tempo_raw).reshape(-1)[0])
+    # 너무 작으면 ×2, 너무 크면 ÷2
+    if tempo_val < 60:
+        tempo_val *= 2
+    elif tempo_val > 200:
+        tempo_val /= 2
+    tempo_val = max(40, min(tempo_val, 300))
+    if math.isnan(tempo_val) or tempo_val <= 0:
+        tempo_val = 120
+
+    # ★추가★ 비트 프레임 -> 시간(초)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr)
+
+    # 3) 크로마 CENS (노이즈에 더 강함) + 비트 싱크
+    chroma = librosa.feature.chroma_cens(y=y_h, sr=sr, hop_length=512)
+    chroma_sync = librosa.util.sync(
+        chroma, beat_frames, aggregate=np.median).T  # (T, 12)
+
+    return {
+        "tempo": tempo_val,
+        "beat_times": beat_times,
+        "chroma_sync": chroma_sync,
+    }
+
+
+def decode_chords(feats):
+    """가벼운 단계: 템플릿 매칭 + Viterbi + 병합 → (분석 결과, 추천용 특징 벡터)"""
+    tempo_val = feats["tempo"]
+    beat_times = feats["beat_times"]
+    chroma_sync = feats["chroma_sync"]
+
+    # 4) 템플릿 매칭
+    chord_names, templates = build_chord_templates()
+    # cosine 유사도
+    norm_chroma = chroma_sync / \
+        (np.linalg.norm(chroma_sync, axis=1, keepdims=True) + 1e-9)
+    norm_temp = templates / \
+        (np.linalg.norm(templates, axis=1, keepdims=True) + 1e-9)
+    sims = norm_chroma @ norm_temp.T
+    # ───── Gaussian으로 시간축 평활화 ─────
+    sims = gaussian_filter1d(sims, sigma=SMOOTH_SIGMA, axis=0)
+
+    # 5) Viterbi로 연속성 보정
+    path = viterbi_decode(sims, switch_penalty=SWITCH_PENALTY)
+
+    # 6) 타임라인 병합
+    chord_segments = merge_segments(
+        path, chord_names, beat_times, min_dur=MIN_SEGMENT_DUR)
+
+    # 7) 키 추정
+    est_key = estimate_key_from_chords(
+        [seg["chord"] for seg in chord_segments])
+
+    # 8) 코드 다이어그램
+    unique = list(dict.fromkeys([seg["chord"] for seg in chord_segments]))
+    chord_charts = [CHORD_CHARTS.get(
+        c, CHORD_CHARTS["C"]) for c in unique if c in CHORD_CHARTS]
+
+    result = {
+        "bpm": int(round(tempo_val)),
+        "signature": "4/4",
+        "key": f"{est_key} Major",
+        "chords": chord_segments,
+        "chordCharts": chord_charts
+    }
+    features = build_feature_vector(
+        chord_segments, chroma_sync, tempo_val, est_key)
+    return result, features
+
+
+def _feature_cache_path(cache_key):
+    if not valid_video_id(cache_key):
+        raise ValueError(f"invalid cache key: {cache_key!r}")
+    return os.path.join(FEATURE_CACHE_DIR, f"{cache_key}.npz")
+
+
+def load_cached_features(cache_key):
+    """캐시된 특징(같은 FEATURE_VERSION)이 있으면 반환, 없으면 None"""
+    path = _feature_cache_path(cache_key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != FEATURE_VERSION:
+                return None
+            return {
+                "tempo": float(data["tempo"]),
+                "beat_times": data["beat_times"],
+                "chroma_sync": data["chroma_sync"],
+            }
+    except Exception as e:
+        logging.warning(f"[feature-cache] broken cache {path}: {e}")
+        return None
+
+
+def save_cached_features(cache_key, feats):
+    """
+    특징 캐시 저장. 같은 곡을 동시에 분석하는 프로세스/스레드가 있어도 서로의 임시 파일을
+    건드리지 않도록 고유한 임시 파일에 쓴 뒤 교체. 실패해도 분석은 계속 (성공 여부 반환)
+    """
+    tmp = None
+    try:
+        os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+        path = _feature_cache_path(cache_key)
+        fd, tmp = tempfile.mkstemp(dir=FEATURE_CACHE_DIR, prefix=f"{cache_key}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, version=FEATURE_VERSION, tempo=feats["tempo"],
+                                beat_times=feats["beat_times"],
+                                chroma_sync=feats["chroma_sync"])
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logging.warning(f"[feature-cache] failed to save {cache_key}: {e}")
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def analyze_audio_for_chords(audio_path, with_features=False, cache_key=None):
+    """
+    오디오에서 코드/타임라인 추출 (librosa만 사용)
+    with_features=True 면 (결과, 추천용 특징 벡터) 튜플 반환
+    cache_key(보통 video_id)를 주면 특징 추출 결과를 캐시/재사용
+    """
+    try:
+        feats = load_cached_features(cache_key) if cache_key else None
+        if feats is None:
+            y, sr = safe_load_audio(audio_path, duration=60)
+            feats = extract_features(y, sr)
+            if cache_key:
+                save_cached_features(cache_key, feats)
+
+        result, features = decode_chords(feats)
+        if with_features:
+            return result, features
+        return result
+    except Exception as e:
+        logging.exception(f"Audio analysis failed: {e}")
+        raise
+
+
+def warm_up(seconds=8.0, sr=44100):
+    """
+    합성 클립(C-G-Am-F 톱니파 + 노이즈, 0.5초마다 어택)을 전체 파이프라인에 통과시켜
+    librosa 하위 모듈 로딩과 numba JIT 컴파일을 미리 끝낸다. 걸린 시간(초) 반환
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sr * seconds / 4)) / sr
+    env = np.exp(-3 * (t % 0.5))
+    clip = []
+    for root in (0, 7, 9, 5):
+        name = KEYS[root] + ("m" if root == 9 else "")
+        freqs = 261.63 * 2 ** ((root + (MINOR if name.endswith("m") else MAJOR)) / 12)
+        tone = sum(2 * ((f * t) % 1.0) - 1 for f in freqs)
+        clip.append((tone + 0.5 * rng.standard_normal(len(t))) * env)
+    y = (0.1 * np.concatenate(clip)).astype(np.float32)
+
+    # 실제 요청처럼 파일에서 읽어야 librosa.load / 리샘플링 경로까지 예열됨
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        sf.write(path, y, sr)
+        analyze_audio_for_chords(path, with_features=True)
+    finally:
+        os.remove(path)
+    return time.perf_counter() - started
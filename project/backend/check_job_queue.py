@@ -0,0 +1,351 @@
+# check_job_queue.py
+"""
+analysis_jobs 작업 큐를 실제 MySQL 에 띄워서 점검 (다운로드/분석은 가짜 파이프라인)
+
+    docker compose up -d mysql
+    python check_job_queue.py --workers 4 --jobs 40
+
+확인하는 것
+- uq_active_video 마이그레이션: 예전 테이블에 중복된 대기/진행 중 작업이 있어도 하나만 남기고 UNIQUE 인덱스 추가
+- enqueue_job: 동시에 같은 곡을 넣어도 작업 하나 (id = LAST_INSERT_ID(id) 로 기존 id 반환),
+  PREVIEW 작업을 INTERACTIVE 로 다시 넣을 때만 promoted (rowcount == 2)
+- worker.py 프로세스 N 개가 작업 M 개를 각각 정확히 한 번씩 끝냄
+- SIGKILL 된 워커의 작업은 임대가 끝나기 전에는 그대로, 끝난 뒤 다른 워커가 다시 가져가서 끝냄
+- 끝난 작업이 다시 들어오면 새 작업이 생김 (active_video_id 가 NULL 로 바뀜)
+- purge_finished_jobs: 보관 기간이 지난 done/failed 행만 삭제
+
+전용 DB(--db-name, 기본 autochord_jobcheck)의 analysis_jobs 를 지우고 다시 만든다.
+"""
+import os
+import sys
+import time
+import types
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from versions import PIPELINE_VERSION
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 마이그레이션 전 analysis_jobs (priority/prefetch/active_video_id 가 없던 때)
+LEGACY_JOBS_TABLE = """
+    CREATE TABLE analysis_jobs (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        video_id VARCHAR(20) NOT NULL,
+        status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 3,
+        worker_id VARCHAR(100),
+        lease_expires_at DATETIME(3),
+        heartbeat_at DATETIME(3),
+        result JSON,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_status_lease (status, lease_expires_at),
+        INDEX idx_video_status (video_id, status)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def check(cond, message):
+    if not cond:
+        raise AssertionError(message)
+    print(f"  ok  {message}")
+
+
+def wait_until(cond, timeout, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = cond()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+# ---- 워커 프로세스 (가짜 파이프라인) ----
+def fake_analysis_module(job_seconds, log_path):
+    """worker.py 가 가져다 쓰는 analysis 모듈 대신 — librosa/yt-dlp 없이 job_seconds 초 걸리는 척"""
+    fake = types.ModuleType("analysis")
+    fake.PIPELINE_VERSION = PIPELINE_VERSION
+
+    def download_audio_from_youtube(url, output_dir):
+        time.sleep(job_seconds / 2)
+        return None
+
+    def analyze_audio_for_chords(audio_path, with_features=False, cache_key=None):
+        time.sleep(job_seconds / 2)
+        # 분석을 끝까지 마친 경우만 기록 (O_APPEND 한 줄 쓰기라 프로세스끼리 섞이지 않음)
+        with open(log_path, "a") as f:
+            f.write(f"{cache_key} {os.getpid()}\n")
+        result = {"bpm": 120, "signature": "4/4", "key": "C Major",
+                  "chords": [{"chord": "C", "start": 0.0, "end": 1.0}], "chordCharts": []}
+        return (result, None) if with_features else result
+
+    fake.download_audio_from_youtube = download_audio_from_youtube
+    fake.analyze_audio_for_chords = analyze_audio_for_chords
+    fake.warm_up = lambda: 0.0
+    return fake
+
+
+def run_worker_process(args):
+    sys.modules["analysis"] = fake_analysis_module(args.job_seconds, args.log)
+    import worker
+    worker.POLL_INTERVAL = 0.2
+    worker.run_worker(args.lease)
+
+
+# ---- 점검 ----
+def jobs_rows(cursor, where="1=1", params=()):
+    cursor.execute(f"SELECT id, video_id, status, attempts, worker_id, error "
+                   f"FROM analysis_jobs WHERE {where} ORDER BY id", params)
+    return cursor.fetchall()
+
+
+def check_migration(database):
+    print("[1] uq_active_video 마이그레이션 (중복 정리)")
+    database.create_database()
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS analysis_jobs")
+        cursor.execute(LEGACY_JOBS_TABLE)
+        cursor.executemany(
+            "INSERT INTO analysis_jobs (video_id, status) VALUES (%s, %s)",
+            [("dupvideo001", "queued"), ("dupvideo001", "running"),
+             ("dupvideo001", "queued"), ("dupvideo001", "done"),
+             ("onlyvideo01", "queued")])
+        connection.commit()
+
+    database.init_database()
+
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        rows = jobs_rows(cursor, "video_id = %s", ("dupvideo001",))
+        active = [r for r in rows if r[2] in ("queued", "running")]
+        check(len(active) == 1 and active[0][0] == rows[0][0],
+              "중복된 대기/진행 중 작업 중 가장 오래된 것만 남음")
+        check(sum(r[5] == "duplicate job" for r in rows) == 2,
+              "나머지는 failed ('duplicate job')")
+        check(len(jobs_rows(cursor, "video_id = %s AND status = 'queued'",
+                            ("onlyvideo01",))) == 1, "중복 없는 작업은 그대로")
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'analysis_jobs'
+              AND INDEX_NAME = 'uq_active_video' AND NON_UNIQUE = 0
+        """, (database.DB_CONFIG["database"],))
+        check(cursor.fetchone()[0] == 1, "uq_active_video UNIQUE 인덱스 추가됨")
+        cursor.execute("DELETE FROM analysis_jobs")
+        cursor.execute("DELETE FROM analyzed_songs")
+        connection.commit()
+
+
+def check_enqueue(database, jobs):
+    print("[2] enqueue_job (동시 등록 / LAST_INSERT_ID / promoted)")
+    results = []
+    lock = threading.Lock()
+
+    def enqueue():
+        r = jobs.enqueue_job("samevideo01")
+        with lock:
+            results.append(r)
+
+    threads = [threading.Thread(target=enqueue) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check(len({job_id for job_id, _ in results}) == 1,
+          "같은 곡을 16개 스레드가 동시에 넣어도 같은 작업 id")
+    check(not any(promoted for _, promoted in results), "INTERACTIVE 끼리는 promoted 아님")
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        check(len(jobs_rows(cursor, "video_id = %s", ("samevideo01",))) == 1, "작업 행은 하나")
+
+    preview_id, promoted = jobs.enqueue_job("prevideo001", priority=jobs.PRIORITY_PREVIEW)
+    check(not promoted, "새 PREVIEW 작업은 promoted 아님")
+    check(jobs.enqueue_job("prevideo001", priority=jobs.PRIORITY_PREVIEW) == (preview_id, False),
+          "같은 PREVIEW 를 다시 넣으면 같은 id, promoted 아님")
+    check(jobs.enqueue_job("prevideo001") == (preview_id, True),
+          "PREVIEW 를 INTERACTIVE 로 다시 넣으면 같은 id, promoted (rowcount == 2)")
+    check(jobs.enqueue_job("prevideo001") == (preview_id, False),
+          "이미 승격된 작업은 다시 promoted 되지 않음")
+    job = jobs.get_job(preview_id)
+    check(job["priority"] == jobs.PRIORITY_INTERACTIVE, "승격된 작업의 우선순위는 INTERACTIVE")
+
+    interactive_id, _ = jobs.enqueue_job("intvideo001")
+    check(jobs.enqueue_job("intvideo001", priority=jobs.PRIORITY_PREVIEW) == (interactive_id, False),
+          "INTERACTIVE 작업에 PREVIEW 를 넣어도 promoted 아님")
+    check(jobs.get_job(interactive_id)["priority"] == jobs.PRIORITY_INTERACTIVE,
+          "우선순위는 내려가지 않음")
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT video_id, prefetch FROM analysis_jobs WHERE id IN (%s, %s)",
+                       (preview_id, interactive_id))
+        prefetch = dict(cursor.fetchall())
+    check(prefetch == {"prevideo001": jobs.PREFETCH_USED, "intvideo001": jobs.PREFETCH_NONE},
+          "prefetch: 승격된 PREVIEW 는 USED, INTERACTIVE 는 NONE")
+    return ["samevideo01", "prevideo001", "intvideo001"]
+
+
+def start_workers(args, count):
+    procs = []
+    for i in range(count):
+        log = open(os.path.join(args.workdir, f"worker-{i}.log"), "w")
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker-process",
+             "--lease", str(args.lease), "--job-seconds", str(args.job_seconds),
+             "--log", args.log],
+            cwd=args.workdir, env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT))
+    return procs
+
+
+def check_workers(database, jobs, args, video_ids):
+    print(f"[3] 워커 {args.workers}개 / 작업 {len(video_ids)}개")
+    procs = start_workers(args, args.workers)
+    pids = {p.pid: p for p in procs}
+    try:
+        # 진행 중인 작업 하나를 골라 그 워커를 SIGKILL
+        def running_job():
+            with database.get_db_connection() as connection:
+                cursor = connection.cursor()
+                for job_id, vid, status, attempts, worker_id, _ in jobs_rows(
+                        cursor, "status = 'running'"):
+                    if int(worker_id.rsplit(":", 1)[1]) in pids:
+                        return job_id, worker_id
+            return None
+
+        victim = wait_until(running_job, 30, interval=0.05)
+        check(victim is not None, "워커가 작업을 가져감")
+        victim_job, victim_worker = victim
+        os.kill(int(victim_worker.rsplit(":", 1)[1]), signal.SIGKILL)
+        print(f"      job {victim_job} 을 처리하던 {victim_worker} 를 SIGKILL")
+
+        def lease_state():
+            with database.get_db_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT status, worker_id, lease_expires_at > NOW(3) "
+                               "FROM analysis_jobs WHERE id = %s", (victim_job,))
+                return cursor.fetchone()
+
+        held = True
+        while True:
+            status, worker_id, leased = lease_state()
+            if not leased:
+                break
+            held = held and status == "running" and worker_id == victim_worker
+            time.sleep(0.2)
+        check(held, "임대가 남아 있는 동안은 죽은 워커의 작업을 아무도 가져가지 않음")
+
+        def all_done():
+            with database.get_db_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT COUNT(*) FROM analysis_jobs WHERE status <> 'done'")
+                return cursor.fetchone()[0] == 0
+
+        timeout = args.lease * 2 + len(video_ids) * args.job_seconds / max(args.workers - 1, 1) + 30
+        check(wait_until(all_done, timeout), "모든 작업이 done")
+
+        with database.get_db_connection() as connection:
+            cursor = connection.cursor()
+            rows = jobs_rows(cursor)
+        by_id = {r[0]: r for r in rows}
+        check(sorted(r[1] for r in rows) == sorted(video_ids), "곡마다 작업 하나")
+        check(by_id[victim_job][3] == 2 and by_id[victim_job][4] != victim_worker,
+              "죽은 워커의 작업은 다른 워커가 두 번째 시도로 끝냄")
+        check(all(r[3] == 1 for r in rows if r[0] != victim_job), "나머지 작업은 한 번에 끝남")
+        with open(args.log) as f:
+            finished = Counter(line.split()[0] for line in f if line.strip())
+        check(all(finished[v] == 1 for v in video_ids) and sum(finished.values()) == len(video_ids),
+              "곡마다 분석은 정확히 한 번 끝남")
+        with database.get_db_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM analyzed_songs WHERE pipeline_version = %s",
+                           (PIPELINE_VERSION,))
+            check(cursor.fetchone()[0] == len(video_ids), "분석 결과가 analyzed_songs 에 저장됨")
+
+        print("[4] 끝난 곡 다시 등록")
+        again_id, promoted = jobs.enqueue_job(video_ids[0])
+        check(again_id not in by_id and not promoted, "끝난 곡을 다시 넣으면 새 작업")
+        check(wait_until(lambda: jobs.get_job(again_id)["status"] == "done", 30),
+              "새 작업도 done")
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in procs:
+            p.wait()
+
+
+def check_purge(database, jobs):
+    print("[5] purge_finished_jobs")
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM analysis_jobs")
+        total = cursor.fetchone()[0]
+        cursor.execute("""
+            UPDATE analysis_jobs SET updated_at = NOW() - INTERVAL 2 DAY
+            WHERE status = 'done' ORDER BY id LIMIT 5
+        """)
+        cursor.execute("INSERT INTO analysis_jobs (video_id) VALUES ('queuedvid01')")
+        cursor.execute("""
+            UPDATE analysis_jobs SET updated_at = NOW() - INTERVAL 2 DAY
+            WHERE video_id = 'queuedvid01'
+        """)
+        connection.commit()
+    check(jobs.purge_finished_jobs(86400, batch_size=2) == 5,
+          "보관 기간이 지난 done 행만 삭제 (배치를 나눠도 전부)")
+    with database.get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM analysis_jobs")
+        check(cursor.fetchone()[0] == total - 5 + 1, "최근 행과 대기 중인 작업은 남음")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="analysis_jobs 작업 큐 점검 (가짜 파이프라인)")
+    parser.add_argument("--workers", type=int, default=4, help="워커 프로세스 수 (2 이상)")
+    parser.add_argument("--jobs", type=int, default=40, help="등록할 작업 수")
+    parser.add_argument("--lease", type=int, default=6, help="작업 임대 시간(초)")
+    parser.add_argument("--job-seconds", type=float, default=1.0, help="가짜 분석 한 번에 걸리는 시간(초)")
+    parser.add_argument("--db-host", default="127.0.0.1")
+    parser.add_argument("--db-port", default="3307")
+    parser.add_argument("--db-user", default="root")
+    parser.add_argument("--db-password", default="autochord")
+    parser.add_argument("--db-name", default="autochord_jobcheck",
+                        help="점검용 DB (analysis_jobs 를 지우고 다시 만듦)")
+    parser.add_argument("--worker-process", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--log", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_process:
+        run_worker_process(args)
+        return
+    if args.workers < 2:
+        parser.error("--workers 는 2 이상이어야 합니다 (하나는 SIGKILL)")
+
+    # 워커 프로세스도 같은 DB 를 보도록 환경 변수로 넘김 (database.py 는 import 시점에 읽음)
+    os.environ.update(DB_HOST=args.db_host, DB_PORT=str(args.db_port), DB_USER=args.db_user,
+                      DB_PASSWORD=args.db_password, DB_NAME=args.db_name)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "db"))
+    import database
+    import jobs
+
+    args.workdir = tempfile.mkdtemp(prefix="jobcheck-")
+    args.log = os.path.join(args.workdir, "finished.log")
+    print(f"DB {args.db_user}@{args.db_host}:{args.db_port}/{args.db_name}, 로그 {args.workdir}")
+
+    check_migration(database)
+    video_ids = check_enqueue(database, jobs)
+    video_ids += [f"jc{i:09d}" for i in range(args.jobs)]
+    for vid in video_ids[3:]:
+        jobs.enqueue_job(vid)
+    check_workers(database, jobs, args, video_ids)
+    check_purge(database, jobs)
+    print("모든 점검 통과")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# chord_index.py
+"""코드 진행 검색 인덱스
+
+merge_segments 결과(코드 타임라인)를 곡마다 한 줄의 바이트열로 압축하고,
+조옮김 정규화된 코드 n-gram → 곡 번호 posting list 로 역색인한다.
+"I-V-vi-IV" 같은 상대 진행(모든 키)과 "Em-C-G-D" 같은 절대 진행을 모두 지원한다.
+"""
+import re
+import json
+import threading
+import logging
+from array import array
+
+import numpy as np
+
+KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLATS = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#',
+         'Cb': 'B', 'Fb': 'E', 'E#': 'F', 'B#': 'C'}
+# 장음계 기준 로마 숫자 → 반음 간격
+ROMAN_DEGREES = {'I': 0, 'II': 2, 'III': 4,
+                 'IV': 5, 'V': 7, 'VI': 9, 'VII': 11}
+
+GRAM_SIZES = (2, 3)   # 색인하는 n-gram 길이 (더 긴 질의는 검증 단계에서 처리)
+MAX_QUERY_LEN = 16
+
+_CHORD_RE = re.compile(r"^([A-Ga-g])([#b♯♭]?)(m|min|maj|M)?$")
+_ROMAN_RE = re.compile(r"^([#b♯♭]?)(VII|VI|V|IV|III|II|I|vii|vi|v|iv|iii|ii|i)$")
+_SPLIT_RE = re.compile(r"[\s,\-–—>→|]+")
+
+
+class QueryError(ValueError):
+    """잘못된 검색어"""
+
+
+def chord_code(name):
+    """코드 이름 → 0..23 정수 (root*2 + minor). 해석 불가하면 None"""
+    m = _CHORD_RE.match(name.strip())
+    if not m:
+        return None
+    letter, acc, quality = m.groups()
+    root_name = letter.upper() + acc.replace('♯', '#').replace('♭', 'b')
+    root_name = FLATS.get(root_name, root_name)
+    if root_name not in KEYS:
+        return None
+    minor = 1 if quality in ('m', 'min') else 0
+    return KEYS.index(root_name) * 2 + minor
+
+
+def key_root(song_key):
+    """'G Major' / 'Em' 같은 키 문자열 → 루트 반음 번호(0..11). 없으면 -1"""
+    if not song_key:
+        return -1
+    code = chord_code(str(song_key).split()[0])
+    return -1 if code is None else code // 2
+
+
+def _roman_code(token):
+    m = _ROMAN_RE.match(token)
+    if not m:
+        return None
+    acc, numeral = m.groups()
+    shift = {'#': 1, '♯': 1, 'b': -1, '♭': -1}.get(acc, 0)
+    root = (ROMAN_DEGREES[numeral.upper()] + shift) % 12
+    return root * 2 + (0 if numeral.isupper() else 1)
+
+
+def parse_progression(query):
+    """
+    검색어 → (codes, absolute)
+    로마 숫자면 상대 진행(absolute=False), 코드 이름이면 절대 진행(absolute=True)
+    """
+    tokens = [t for t in _SPLIT_RE.split(query or "") if t]
+    if len(tokens) < 2:
+        raise QueryError("코드를 2개 이상 입력해주세요")
+    if len(tokens) > MAX_QUERY_LEN:
+        raise QueryError(f"코드는 최대 {MAX_QUERY_LEN}개까지 검색할 수 있습니다")
+
+    romans = [_roman_code(t) for t in tokens]
+    chords = [chord_code(t) for t in tokens]
+    if all(c is not None for c in romans):
+        codes, absolute = romans, False
+    elif all(c is not None for c in chords):
+        codes, absolute = chords, True
+    else:
+        raise QueryError("코드 이름(C, Em, Bb …) 또는 로마 숫자(I, V, vi …) 중 하나로만 입력해주세요")
+
+    # 색인된 곡과 같은 방식(_collapse)으로 연속된 같은 코드는 하나로
+    codes = [c for i, c in enumerate(codes) if i == 0 or c != codes[i - 1]]
+    if len(codes) < 2:
+        raise QueryError("서로 다른 코드를 2개 이상 입력해주세요")
+    return codes, absolute
+
+
+def normalize(codes):
+    """첫 코드 루트를 0으로 맞춘 조옮김 정규화 튜플"""
+    r0 = codes[0] // 2
+    return tuple((((c // 2) - r0) % 12) * 2 + (c & 1) for c in codes)
+
+
+def transpose(codes, shift):
+    return bytes((((c // 2) + shift) % 12) * 2 + (c & 1) for c in codes)
+
+
+def _collapse(segments):
+    """세그먼트 → (코드 바이트열, 시작 시각 배열). 같은 코드가 연속되면 하나로 합침"""
+    codes = bytearray()
+    times = array('f')
+    for seg in segments or []:
+        code = chord_code(seg.get("chord", ""))
+        if code is None:
+            continue
+        if codes and codes[-1] == code:
+            continue
+        codes.append(code)
+        times.append(float(seg.get("timestamp", 0.0)))
+    return bytes(codes), times
+
+
+class ChordIndex:
+    """
+    곡 번호(정수)를 단위로 하는 추가 전용 역색인.
+    재분석으로 같은 곡이 다시 들어오면 예전 번호는 묘비(None) 처리하고 새 번호를 붙인다.
+    posting list 는 번호가 증가하는 순으로 쌓이므로 항상 정렬 상태를 유지한다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}          # n-gram 튜플 -> array('I') 곡 번호
+        self._ids = []               # 곡 번호 -> video_id (삭제되면 None)
+        self._seqs = []              # 곡 번호 -> 코드 바이트열
+        self._times = []             # 곡 번호 -> 시작 시각 array('f')
+        self._keys = array('b')      # 곡 번호 -> 키 루트 (-1: 모름)
+        self._num = {}               # video_id -> 곡 번호
+
+    def __len__(self):
+        return len(self._num)
+
+    def add_song(self, video_id, segments, song_key=None):
+        """분석 결과 하나를 색인(이미 있으면 교체)"""
+        seq, times = _collapse(segments)
+        with self._lock:
+            old = self._num.get(video_id)
+            if (old is not None and self._seqs[old] == seq and self._times[old] == times
+                    and self._keys[old] == key_root(song_key)):
+                return      # 같은 결과가 다시 들어옴 (동기화 등) — 묘비를 남기지 않음
+            self._num.pop(video_id, None)
+            if old is not None:
+                self._ids[old] = None
+                self._seqs[old] = None
+                self._times[old] = None
+            if len(seq) < min(GRAM_SIZES):
+                return
+
+            num = len(self._ids)
+            self._ids.append(video_id)
+            self._seqs.append(seq)
+            self._times.append(times)
+            self._keys.append(key_root(song_key))
+            self._num[video_id] = num
+
+            seen = set()
+            for n in GRAM_SIZES:
+                for i in range(len(seq) - n + 1):
+                    gram = normalize(seq[i:i + n])
+                    if gram in seen:
+                        continue
+                    seen.add(gram)
+                    self._postings.setdefault(gram, array('I')).append(num)
+
+    def remove_song(self, video_id):
+        with self._lock:
+            old = self._num.pop(video_id, None)
+            if old is not None:
+                self._ids[old] = None
+                self._seqs[old] = None
+                self._times[old] = None
+
+    def search(self, codes, absolute=False, song_key=None, limit=20, max_hits=8):
+        """
+        codes: parse_progression 결과
+        absolute: True 면 입력한 키 그대로, False 면 12개 조 모두 매칭
+        song_key: 곡 키 필터 ('G', 'G Major' …)
+        """
+        want_key = key_root(song_key) if song_key else None
+        if song_key and want_key < 0:
+            raise QueryError("알 수 없는 키입니다")
+
+        norm = normalize(codes)
+        n = max(g for g in GRAM_SIZES if g <= len(norm))
+        grams = {norm[i:i + n] for i in range(len(norm) - n + 1)}
+        if absolute:
+            patterns = [bytes(codes)]
+        else:
+            patterns = [transpose(norm, s) for s in range(12)]
+
+        results = []
+        with self._lock:
+            lists = [self._postings.get(normalize(g)) for g in grams]
+            if not all(lists):
+                return results
+            # posting list 교집합(+ 키 필터)으로 후보를 줄인 뒤 바이트열 검색으로 검증
+            candidates = self._candidates(lists, want_key)
+            for num in self._iter_chunks(candidates):
+                seq = self._seqs[num]
+                if seq is None:
+                    continue
+                hits = self._find_all(seq, patterns, max_hits)
+                if not hits:
+                    continue
+                times = self._times[num]
+                results.append({
+                    "videoId": self._ids[num],
+                    "key": KEYS[self._keys[num]] if self._keys[num] >= 0 else None,
+                    "timestamps": [round(float(times[i]), 2) for i in hits],
+                })
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _candidates(self, lists, want_key):
+        """
+        정렬된 posting list 들의 교집합 (self._lock 을 잡은 상태에서 호출)
+        짧은 목록부터 이분 탐색으로 걸러 나가므로 비용은 가장 짧은 목록 길이에 비례한다.
+        반환값은 복사본이라 array 버퍼를 붙잡고 있지 않음 (이후 append 가능)
+        """
+        lists = sorted(lists, key=len)
+        cand = np.array(lists[0], dtype=np.uint32)
+        for posting in lists[1:]:
+            if not len(cand):
+                break
+            other = np.frombuffer(posting, dtype=np.uint32)
+            pos = np.searchsorted(other, cand)
+            pos[pos == len(other)] = 0
+            cand = cand[other[pos] == cand]
+            del other
+        if want_key is not None and len(cand):
+            keys = np.frombuffer(self._keys, dtype=np.int8)
+            cand = cand[keys[cand] == want_key]
+            del keys
+        return cand
+
+    @staticmethod
+    def _iter_chunks(candidates, size=256):
+        # limit 에 금방 도달하는 흔한 진행에서 후보 전체를 list 로 바꾸지 않도록 조금씩
+        for i in range(0, len(candidates), size):
+            yield from candidates[i:i + size].tolist()
+
+    @staticmethod
+    def _find_all(seq, patterns, max_hits):
+        hits = []
+        for pat in patterns:
+            pos = seq.find(pat)
+            while pos != -1 and len(hits) < max_hits:
+                hits.append(pos)
+                pos = seq.find(pat, pos + 1)
+        hits.sort()
+        return hits
+
+    def load_from_db(self, get_db_connection, batch_size=5000):
+        """analyzed_songs 전체를 읽어 색인 재구성 (서버 시작 시 1회)"""
+        last_id = 0
+        count = 0
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+            while True:
+                cursor.execute(
+                    "SELECT id, video_id, song_key, chords FROM analyzed_songs "
+                    "WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for row_id, video_id, song_key, chords in rows:
+                    last_id = row_id
+                    try:
+                        segs = json.loads(chords) if chords else []
+                    except (TypeError, ValueError):
+                        continue
+                    self.add_song(video_id, segs, song_key)
+                    count += 1
+            cursor.close()
+        logging.info(f"[chord-index] loaded {count} songs")
+        return count
@@ -85,15 +85,48 @@ def create_tables():
                 chords JSON,
                 chord_charts JSON,
                 file_path VARCHAR(500),
+                feature_vector BLOB,
+                pipeline_version INT NOT NULL DEFAULT 0,
+                request_count INT NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
                 INDEX idx_video_id (video_id),
-                INDEX idx_title (title(100))
+                INDEX idx_title (title(100)),
+                INDEX idx_updated_at (updated_at),
+                INDEX idx_version_popularity (pipeline_version, request_count)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """
+
+            # 분석 작업 큐 테이블 생성 (분석 워커가 SKIP LOCKED 로 가져감)
+            create_jobs_table = """
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                video_id VARCHAR(20) NOT NULL,
+                status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+                attempts INT NOT NULL DEFAULT 0,
+                max_attempts INT NOT NULL DEFAULT 3,
+                priority TINYINT NOT NULL DEFAULT 0,
+                prefetch TINYINT NOT NULL DEFAULT 0,
+                worker_id VARCHAR(100),
+                lease_expires_at DATETIME(3),
+                heartbeat_at DATETIME(3),
+                result JSON,
+                error TEXT,
+                active_video_id VARCHAR(20) AS (IF(status IN ('queued', 'running'), video_id, NULL)) STORED,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                UNIQUE KEY uq_active_video (active_video_id),
+                INDEX idx_status_lease (status, lease_expires_at),
+                INDEX idx_status_priority (status, priority, id),
+                INDEX idx_video_status (video_id, status),
+                INDEX idx_prefetch (prefetch, status, updated_at),
+                INDEX idx_status_updated (status, updated_at)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """
             
             cursor.execute(create_users_table)
             cursor.execute(create_songs_table)
+            cursor.execute(create_jobs_table)
             
             connection.commit()
             print("테이블 생성 완료")
@@ -102,10 +135,81 @@ def create_tables():
         print(f"테이블 생성 오류: {e}")
         raise
 
+# 기존 테이블에 나중에 추가된 컬럼들 (테이블, 컬럼, 정의)
+MIGRATION_COLUMNS = [
+    ('analyzed_songs', 'feature_vector', 'BLOB'),
+    ('analyzed_songs', 'pipeline_version', 'INT NOT NULL DEFAULT 0'),
+    ('analyzed_songs', 'request_count', 'INT NOT NULL DEFAULT 0'),
+    ('analysis_jobs', 'priority', 'TINYINT NOT NULL DEFAULT 0'),
+    ('analysis_jobs', 'prefetch', 'TINYINT NOT NULL DEFAULT 0'),
+    # 곡마다 대기/진행 중 작업은 하나만 (uq_active_video)
+    ('analysis_jobs', 'active_video_id',
+     "VARCHAR(20) AS (IF(status IN ('queued', 'running'), video_id, NULL)) STORED"),
+]
+
+# 기존 테이블에 나중에 추가된 인덱스들 (테이블, 인덱스, 컬럼)
+MIGRATION_INDEXES = [
+    ('analyzed_songs', 'idx_updated_at', 'updated_at'),
+    ('analyzed_songs', 'idx_version_popularity', 'pipeline_version, request_count'),
+    ('analysis_jobs', 'idx_status_priority', 'status, priority, id'),
+    ('analysis_jobs', 'idx_prefetch', 'prefetch, status, updated_at'),
+    ('analysis_jobs', 'idx_status_updated', 'status, updated_at'),
+]
+
+# 기존 테이블에 나중에 추가된 UNIQUE 인덱스들 (테이블, 인덱스, 컬럼, 추가 전에 실행할 중복 정리 SQL)
+MIGRATION_UNIQUE_INDEXES = [
+    ('analysis_jobs', 'uq_active_video', 'active_video_id', """
+        UPDATE analysis_jobs j
+        JOIN (SELECT video_id, MIN(id) AS keep_id FROM analysis_jobs
+              WHERE status IN ('queued', 'running')
+              GROUP BY video_id HAVING COUNT(*) > 1) d
+          ON j.video_id = d.video_id AND j.id <> d.keep_id
+        SET j.status = 'failed', j.error = 'duplicate job'
+        WHERE j.status IN ('queued', 'running')
+    """),
+]
+
+def migrate_tables():
+    """이미 만들어진 테이블에 빠진 컬럼 추가"""
+    try:
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+            for table, column, definition in MIGRATION_COLUMNS:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                """, (DB_CONFIG['database'], table, column))
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    print(f"컬럼 추가: {table}.{column}")
+            for table, index, columns in MIGRATION_INDEXES:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s
+                """, (DB_CONFIG['database'], table, index))
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} ({columns})")
+                    print(f"인덱스 추가: {table}.{index}")
+            for table, index, columns, dedupe in MIGRATION_UNIQUE_INDEXES:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s
+                """, (DB_CONFIG['database'], table, index))
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(dedupe)
+                    cursor.execute(f"ALTER TABLE {table} ADD UNIQUE INDEX {index} ({columns})")
+                    print(f"UNIQUE 인덱스 추가: {table}.{index}")
+            connection.commit()
+
+    except Error as e:
+        print(f"테이블 마이그레이션 오류: {e}")
+        raise
+
 def init_database():
     """데이터베이스 초기화"""
     create_database()
     create_tables()
+    migrate_tables()
 
 if __name__ == "__main__":
     init_database()
\ No newline at end of file
@@ -0,0 +1,268 @@
+import json
+from database import get_db_connection
+
+# 작업 임대 시간(초). 워커는 이 시간의 1/3 마다 heartbeat 로 임대를 연장한다
+LEASE_SECONDS = 120
+
+# 작업 우선순위 (작을수록 먼저). PREVIEW 는 검색 결과 미리 분석
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREVIEW = 1
+
+# 미리 분석 작업의 결과가 쓰였는지 (prefetch 컬럼)
+PREFETCH_NONE = 0          # 미리 분석 작업이 아님
+PREFETCH_PENDING = 1       # 아직 아무도 가져가지 않음
+PREFETCH_USED = 2          # /analyze 가 결과를 가져가거나 진행 중에 합류함
+PREFETCH_EXPIRED = 3       # 취소/만료 — 쓰이지 않음
+
+# 끝난(done/failed) 작업을 남겨 두는 시간(초). 행마다 분석 결과 JSON 전체가 들어 있으므로
+# /analyze 의 결과 재사용(PREFETCH_RESULT_TTL), GET /jobs/<id> 조회에 필요한 만큼만 보관
+JOB_RETENTION_SECONDS = 86400
+
+
+def enqueue_job(video_id, max_attempts=3, priority=PRIORITY_INTERACTIVE):
+    """
+    분석 작업 등록. 같은 곡의 대기/진행 중 작업이 있으면 그 작업 id 반환
+    (더 높은 우선순위로 들어오면 기존 작업을 승격)
+    곡마다 활성 작업은 uq_active_video 로 하나만 존재하므로 동시에 들어와도 중복 작업이 생기지 않는다.
+    반환: (job_id, promoted) — promoted 는 대기/진행 중인 미리 분석 작업을 가져왔는지 (적중)
+    """
+    prefetch = PREFETCH_PENDING if priority == PRIORITY_PREVIEW else PREFETCH_NONE
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        # 같은 SET 안에서는 앞에서 바꾼 값이 뒤에 보이므로 prefetch 를 priority 보다 먼저 갱신
+        cursor.execute("""
+            INSERT INTO analysis_jobs (video_id, max_attempts, priority, prefetch)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                id = LAST_INSERT_ID(id),
+                prefetch = IF(VALUES(priority) < priority AND prefetch = %s, %s, prefetch),
+                priority = LEAST(priority, VALUES(priority))
+        """, (video_id, max_attempts, priority, prefetch, PREFETCH_PENDING, PREFETCH_USED))
+        connection.commit()
+        # 영향받은 행 2 = 기존 행이 바뀜 (미리 분석 작업이 승격된 경우뿐)
+        return cursor.lastrowid, cursor.rowcount == 2
+
+
+def claim_job(worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    대기 중이거나 임대가 만료된(워커가 죽은) 작업 하나를 가져와 임대.
+    여러 워커가 동시에 호출해도 SKIP LOCKED 로 서로 다른 행을 잡는다.
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, video_id, attempts FROM analysis_jobs
+            WHERE (status = 'queued'
+                   OR (status = 'running' AND lease_expires_at < NOW(3)))
+              AND attempts < max_attempts
+            ORDER BY priority, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        row = cursor.fetchone()
+        if row is None:
+            connection.commit()
+            return None
+
+        job_id, video_id, attempts = row
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = 'running', worker_id = %s, attempts = attempts + 1,
+                lease_expires_at = NOW(3) + INTERVAL %s SECOND, heartbeat_at = NOW(3)
+            WHERE id = %s
+        """, (worker_id, lease_seconds, job_id))
+        connection.commit()
+        return {"id": job_id, "video_id": video_id, "attempt": attempts + 1}
+
+
+def heartbeat(job_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """임대 연장. 다른 워커에게 넘어갔으면 False"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET lease_expires_at = NOW(3) + INTERVAL %s SECOND, heartbeat_at = NOW(3)
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+        """, (lease_seconds, job_id, worker_id))
+        connection.commit()
+        return cursor.rowcount == 1
+
+
+def complete_job(job_id, worker_id, result):
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = 'done', result = %s, error = NULL, lease_expires_at = NULL
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+        """, (json.dumps(result), job_id, worker_id))
+        connection.commit()
+        return cursor.rowcount == 1
+
+
+def fail_job(job_id, worker_id, error):
+    """실패 기록. 재시도 횟수가 남았으면 다시 대기열로"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = IF(attempts >= max_attempts, 'failed', 'queued'),
+                error = %s, worker_id = NULL, lease_expires_at = NULL
+            WHERE id = %s AND worker_id = %s AND status = 'running'
+        """, (str(error)[:2000], job_id, worker_id))
+        connection.commit()
+        return cursor.rowcount == 1
+
+
+def expire_dead_jobs():
+    """임대가 만료됐는데 재시도 횟수도 다 쓴 작업을 실패 처리"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = 'failed', error = 'lease expired', lease_expires_at = NULL
+            WHERE status = 'running' AND lease_expires_at < NOW(3)
+              AND attempts >= max_attempts
+        """)
+        connection.commit()
+        return cursor.rowcount
+
+
+def purge_finished_jobs(retention_seconds=JOB_RETENTION_SECONDS, batch_size=1000):
+    """
+    끝난 지 retention_seconds 초가 지난 done/failed 작업 삭제. 삭제한 행 수 반환
+    한 번에 batch_size 개씩 지워서 긴 잠금/큰 undo 로그를 피한다.
+    """
+    deleted = 0
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        while True:
+            cursor.execute("""
+                DELETE FROM analysis_jobs
+                WHERE status IN ('done', 'failed')
+                  AND updated_at < NOW() - INTERVAL %s SECOND
+                LIMIT %s
+            """, (retention_seconds, batch_size))
+            connection.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+
+def shed_preview_jobs(max_backlog):
+    """
+    대기 중인 INTERACTIVE 작업이 max_backlog 개 이상이면
+    아직 시작하지 않은 PREVIEW 작업을 취소(failed)하고 취소한 개수 반환
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM analysis_jobs
+            WHERE status = 'queued' AND priority = %s
+        """, (PRIORITY_INTERACTIVE,))
+        if cursor.fetchone()[0] < max_backlog:
+            return 0
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = 'failed', error = 'preview cancelled under load', prefetch = %s
+            WHERE status = 'queued' AND priority = %s
+        """, (PREFETCH_EXPIRED, PRIORITY_PREVIEW))
+        connection.commit()
+        return cursor.rowcount
+
+
+def count_queued_previews():
+    """아직 시작하지 않은 PREVIEW 작업 수 (미리 분석 대기열 상한 확인용)"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM analysis_jobs
+            WHERE status = 'queued' AND priority = %s
+        """, (PRIORITY_PREVIEW,))
+        return cursor.fetchone()[0]
+
+
+def expire_preview_jobs(queue_ttl, result_ttl):
+    """
+    오래된 미리 분석 정리. 반환: (cancelled, wasted)
+    - queue_ttl 초 넘게 대기 중인 PREVIEW 작업은 취소 (검색한 사용자는 이미 떠났음)
+    - 끝난 지 result_ttl 초가 지나도록 아무도 가져가지 않은 결과는 낭비로 집계
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analysis_jobs
+            SET status = 'failed', error = 'preview expired', prefetch = %s
+            WHERE status = 'queued' AND priority = %s
+              AND created_at < NOW() - INTERVAL %s SECOND
+        """, (PREFETCH_EXPIRED, PRIORITY_PREVIEW, queue_ttl))
+        cancelled = cursor.rowcount
+        cursor.execute("""
+            UPDATE analysis_jobs SET prefetch = %s
+            WHERE prefetch = %s AND status = 'done'
+              AND updated_at < NOW() - INTERVAL %s SECOND
+        """, (PREFETCH_EXPIRED, PREFETCH_PENDING, result_ttl))
+        wasted = cursor.rowcount
+        connection.commit()
+    return cancelled, wasted
+
+
+def preview_job_counts(since_seconds):
+    """최근 since_seconds 초 동안 등록된 미리 분석 작업 중 완료/실패 수 (취소 제외)"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COALESCE(SUM(status = 'done'), 0),
+                   COALESCE(SUM(status = 'failed' AND prefetch <> %s), 0)
+            FROM analysis_jobs
+            WHERE prefetch <> %s AND created_at >= NOW() - INTERVAL %s SECOND
+        """, (PREFETCH_EXPIRED, PREFETCH_NONE, int(since_seconds)))
+        completed, failed = cursor.fetchone()
+    return {"completed": int(completed), "failed": int(failed)}
+
+
+def find_recent_result(video_id, max_age_seconds):
+    """
+    최근에 끝난 같은 곡 작업(미리 분석 포함)의 {result, hit}. 없으면 None
+    hit: 아직 아무도 가져가지 않은 미리 분석 결과였는지 (이번 호출에서 사용 처리)
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, result, prefetch FROM analysis_jobs
+            WHERE video_id = %s AND status = 'done'
+              AND updated_at >= NOW() - INTERVAL %s SECOND
+            ORDER BY id DESC LIMIT 1
+        """, (video_id, max_age_seconds))
+        row = cursor.fetchone()
+        if not row or not row[1]:
+            return None
+        hit = False
+        if row[2] == PREFETCH_PENDING:
+            cursor.execute(
+                "UPDATE analysis_jobs SET prefetch = %s WHERE id = %s AND prefetch = %s",
+                (PREFETCH_USED, row[0], PREFETCH_PENDING))
+            connection.commit()
+            hit = cursor.rowcount == 1
+    return {"result": json.loads(row[1]), "hit": hit}
+
+
+def get_job(job_id):
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, video_id, status, attempts, result, error, priority
+            FROM analysis_jobs WHERE id = %s
+        """, (job_id,))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {
+        "id": row[0],
+        "videoId": row[1],
+        "status": row[2],
+        "attempts": row[3],
+        "result": json.loads(row[4]) if row[4] else None,
+        "error": row[5],
+        "priority": row[6]
+    }
@@ -0,0 +1,178 @@
+import json
+import logging
+from database import get_db_connection
+
+
+def placeholder_title(video_id):
+    """영상 정보를 모를 때 저장하는 임시 제목"""
+    return f"Video {video_id}"
+
+
+def save_analysis_to_db(video_id, analysis_result, audio_path, features=None,
+                        pipeline_version=0, metadata=None):
+    """
+    분석 결과를 analyzed_songs 에 저장(있으면 갱신). 성공 여부 반환
+    metadata: MetadataService 캐시의 영상 정보 (없으면 임시 제목으로 저장, 기존 제목은 유지)
+    """
+    try:
+        meta = metadata or {}
+        title = meta.get("title")
+        channel_title = meta.get("channelTitle")
+        thumbnail_url = meta.get("thumbnailUrl")
+
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                INSERT INTO analyzed_songs
+                (video_id, title, channel_title, thumbnail_url, bpm, signature, song_key,
+                 chords, chord_charts, file_path, feature_vector, pipeline_version)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    title = COALESCE(%s, title), channel_title = COALESCE(%s, channel_title),
+                    thumbnail_url = COALESCE(%s, thumbnail_url),
+                    bpm = VALUES(bpm), signature = VALUES(signature), song_key = VALUES(song_key),
+                    chords = VALUES(chords), chord_charts = VALUES(chord_charts),
+                    file_path = COALESCE(VALUES(file_path), file_path), feature_vector = VALUES(feature_vector),
+                    pipeline_version = VALUES(pipeline_version),
+                    updated_at = CURRENT_TIMESTAMP
+            """, (
+                video_id,
+                title or placeholder_title(video_id),
+                channel_title or "Unknown",
+                thumbnail_url or f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+                analysis_result.get('bpm'),
+                analysis_result.get('signature'),
+                analysis_result.get('key'),
+                json.dumps(analysis_result.get('chords', [])),
+                json.dumps(analysis_result.get('chordCharts', [])),
+                audio_path,
+                features.tobytes() if features is not None else None,
+                pipeline_version,
+                title, channel_title, thumbnail_url
+            ))
+            connection.commit()
+            return True
+    except Exception as e:
+        logging.warning(f"Failed to save analysis to DB: {e}")
+        return False
+
+
+def update_song_metadata(video_id, metadata):
+    """분석 워커가 임시 제목으로 저장한 곡에 실제 제목/채널/썸네일 반영"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            UPDATE analyzed_songs
+            SET title = %s, channel_title = %s, thumbnail_url = %s, updated_at = updated_at
+            WHERE video_id = %s
+        """, (metadata["title"], metadata["channelTitle"], metadata["thumbnailUrl"], video_id))
+        connection.commit()
+
+
+def db_now():
+    """DB 서버 기준 현재 시각 (updated_at 비교용)"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT NOW()")
+        now = cursor.fetchone()[0]
+        cursor.close()
+    return now
+
+
+def fetch_songs_updated_since(since, since_id=0, limit=1000):
+    """
+    (updated_at, id) 가 (since, since_id) 보다 뒤인 곡 — 다른 프로세스(분석 워커)가 저장한 결과를
+    인덱스에 반영할 때 사용. 마지막 행의 (updated_at, id) 를 다음 호출에 넘기면 이어서 읽는다
+    (updated_at 은 초 단위라 같은 초에 갱신된 행이 limit 보다 많아도 id 로 이어서 읽음).
+    늦게 커밋된 행이 커서 앞에 끼어들 수 있으므로 호출하는 쪽은 조금 앞에서부터 다시 읽어야 한다
+    반환: [(id, video_id, title, song_key, chords(list), feature_vector(bytes|None), updated_at)]
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, video_id, title, song_key, chords, feature_vector, updated_at
+            FROM analyzed_songs
+            WHERE updated_at > %s OR (updated_at = %s AND id > %s)
+            ORDER BY updated_at, id
+            LIMIT %s
+        """, (since, since, since_id, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+    return [
+        (row_id, vid, title, key, json.loads(chords) if chords else [], vec, updated_at)
+        for row_id, vid, title, key, chords, vec, updated_at in rows
+    ]
+
+
+def fetch_current_songs(video_ids, pipeline_version):
+    """video_ids 중 pipeline_version 이상으로 이미 분석된 곡의 video_id 집합"""
+    video_ids = list(video_ids)
+    if not video_ids:
+        return set()
+    placeholders = ", ".join(["%s"] * len(video_ids))
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT video_id FROM analyzed_songs
+            WHERE video_id IN ({placeholders}) AND pipeline_version >= %s
+        """, (*video_ids, pipeline_version))
+        rows = cursor.fetchall()
+        cursor.close()
+    return {vid for (vid,) in rows}
+
+
+def load_current_analysis(video_id, pipeline_version):
+    """
+    pipeline_version 이상으로 저장된 분석 결과 (다시 다운로드/분석하지 않고 돌려줄 때)
+    반환: /analyze 응답과 같은 형태의 dict, 없거나 예전 버전이면 None
+    """
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT bpm, signature, song_key, chords, chord_charts FROM analyzed_songs
+            WHERE video_id = %s AND pipeline_version >= %s
+        """, (video_id, pipeline_version))
+        row = cursor.fetchone()
+        cursor.close()
+    if row is None:
+        return None
+    bpm, signature, key, chords, chord_charts = row
+    return {
+        "bpm": bpm,
+        "signature": signature,
+        "key": key,
+        "chords": json.loads(chords) if chords else [],
+        "chordCharts": json.loads(chord_charts) if chord_charts else [],
+    }
+
+
+def record_song_request(video_id):
+    """곡 요청 횟수(인기도) 증가 — 재분석 우선순위에 사용"""
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE analyzed_songs SET request_count = request_count + 1, "
+            "updated_at = updated_at WHERE video_id = %s", (video_id,))
+        connection.commit()
+
+
+def fetch_outdated_songs(pipeline_version, limit=20, exclude=()):
+    """
+    pipeline_version 보다 예전 버전으로 분석된 곡을 인기순으로
+    반환: [(video_id, file_path)]
+    """
+    exclude = list(exclude)
+    skip = ""
+    if exclude:
+        skip = "AND video_id NOT IN (" + ", ".join(["%s"] * len(exclude)) + ")"
+    with get_db_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT video_id, file_path FROM analyzed_songs
+            WHERE pipeline_version < %s {skip}
+            ORDER BY request_count DESC, id
+            LIMIT %s
+        """, (pipeline_version, *exclude, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
@@ -1,16 +1,26 @@
 # main.py ver.5
+import time
+STARTED_AT = time.perf_counter()
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import yt_dlp
 import os
 import uuid
-import librosa
-import numpy as np
-import math
-import json
+import datetime
 import logging
-from pathlib import Path
-from scipy.ndimage import gaussian_filter1d
+import sys
+import threading
+sys.path.append(os.path.join(os.path.dirname(__file__), 'db'))
+from database import get_db_connection
+from songs import (save_analysis_to_db, fetch_songs_updated_since, db_now,
+                   record_song_request, update_song_metadata, placeholder_title,
+                   fetch_current_songs, load_current_analysis)
+import jobs
+import numpy as np
+from chord_index import ChordIndex, QueryError, parse_progression
+from song_vectors import SongVectorIndex
+from scheduler import AnalysisScheduler, PrefetchMetrics, INTERACTIVE, PREVIEW
+from metadata import MetadataService, YouTubeDataClient, valid_video_id
+from versions import PIPELINE_VERSION
 
 logging.basicConfig(level=logging.INFO)
 
@@ -20,264 +30,44 @@ CORS(app)
 OUTPUT_DIR = "downloads"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# 기타 코드 차트 데이터
-CHORD_CHARTS = {
-    'A':   {'chord': 'A',   'frets': [0, 0, 2, 2, 2, 0], 'fingers': [0, 0, 1, 2, 3, 0]},
-    'A#':  {'chord': 'A#',  'frets': [1, 1, 3, 3, 3, 1], 'fingers': [1, 1, 2, 3, 4, 1]},
-    'A#m': {'chord': 'A#m', 'frets': [1, 1, 3, 3, 2, 1], 'fingers': [1, 1, 3, 4, 2, 1]},
-    'Am':  {'chord': 'Am',  'frets': [0, 0, 2, 2, 1, 0], 'fingers': [0, 0, 2, 3, 1, 0]},
-    'B':   {'chord': 'B',   'frets': [2, 2, 4, 4, 4, 2], 'fingers': [1, 1, 2, 3, 4, 1]},
-    'Bb':  {'chord': 'Bb',  'frets': [1, 1, 3, 3, 3, 1], 'fingers': [1, 1, 2, 3, 4, 1]},
-    'Bm':  {'chord': 'Bm',  'frets': [2, 2, 4, 4, 3, 2], 'fingers': [1, 1, 3, 4, 2, 1]},
-    'C':   {'chord': 'C',   'frets': [0, 3, 2, 0, 1, 0], 'fingers': [0, 3, 2, 0, 1, 0]},
-    'C#':  {'chord': 'C#',  'frets': [-1, 4, 6, 6, 6, 4], 'fingers': [0, 1, 3, 4, 2, 1]},
-    'C#m': {'chord': 'C#m', 'frets': [4, 4, 6, 6, 5, 4], 'fingers': [1, 1, 3, 4, 2, 1]},
-    'Cm':  {'chord': 'Cm',  'frets': [-1, 3, 5, 5, 4, 3], 'fingers': [0, 1, 3, 4, 2, 1]},
-    'D':   {'chord': 'D',   'frets': [-1, 0, 0, 2, 3, 2], 'fingers': [0, 0, 0, 1, 3, 2]},
-    'D#':  {'chord': 'D#',  'frets': [-1, 6, 8, 8, 8, 6], 'fingers': [0, 1, 3, 4, 2, 1]},
-    'D#m': {'chord': 'D#m', 'frets': [-1, 6, 8, 8, 7, 6], 'fingers': [0, 1, 3, 4, 2, 1]},
-    'Dm':  {'chord': 'Dm',  'frets': [-1, 0, 0, 2, 3, 1], 'fingers': [0, 0, 0, 2, 3, 1]},
-    'E':   {'chord': 'E',   'frets': [0, 2, 2, 1, 0, 0], 'fingers': [0, 2, 3, 1, 0, 0]},
-    'Em':  {'chord': 'Em',  'frets': [0, 2, 2, 0, 0, 0], 'fingers': [0, 1, 2, 0, 0, 0]},
-    'F':   {'chord': 'F',   'frets': [1, 3, 3, 2, 1, 1], 'fingers': [1, 3, 4, 2, 1, 1]},
-    'F#':  {'chord': 'F#',  'frets': [2, 4, 4, 3, 2, 2], 'fingers': [1, 3, 4, 2, 1, 1]},
-    'Fm':  {'chord': 'Fm',  'frets': [1, 3, 3, 1, 1, 1], 'fingers': [1, 3, 4, 1, 1, 1]},
-    'F#m': {'chord': 'F#m', 'frets': [2, 4, 4, 2, 2, 2], 'fingers': [1, 3, 4, 1, 1, 1]},
-    'G':   {'chord': 'G',   'frets': [3, 2, 0, 0, 3, 3], 'fingers': [3, 1, 0, 0, 4, 4]},
-    'G#':  {'chord': 'G#',  'frets': [4, 6, 6, 5, 4, 4], 'fingers': [1, 3, 4, 2, 1, 1]},
-    'G#m': {'chord': 'G#m', 'frets': [4, 6, 6, 4, 4, 4], 'fingers': [1, 3, 4, 1, 1, 1]},
-    'Gm':  {'chord': 'Gm',  'frets': [3, 3, 5, 5, 3, 3], 'fingers': [1, 1, 3, 4, 1, 1]},
-}
-
-KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-
-# ---- 추가: 코드 템플릿/디코딩 유틸 ----
-MAJOR = np.array([0, 4, 7])
-MINOR = np.array([0, 3, 7])
-
-
-def build_chord_templates():
-    """24개(12메이저+12마이너) 코드 템플릿 반환"""
-    names = []
-    mats = []
-    for i, root in enumerate(KEYS):
-        vecM = np.zeros(12)
-        vecM[(i + MAJOR) % 12] = 1
-        vecm = np.zeros(12)
-        vecm[(i + MINOR) % 12] = 1
-        mats.append(vecM / vecM.sum())
-        names.append(root)
-        mats.append(vecm / vecm.sum())
-        names.append(root + "m")
-    return names, np.array(mats, dtype=float)
-
-
-def viterbi_decode(score_matrix, switch_penalty=0.2):
-    """
-    score_matrix: (T, N)  값이 클수록 그 코드일 확률이 높다고 봄
-    switch_penalty: 코드가 바뀔 때 패널티
-    """
-    T, N = score_matrix.shape
-    dp = np.zeros((T, N), dtype=float)
-    back = np.zeros((T, N), dtype=int)
-
-    dp[0] = score_matrix[0]
-    for t in range(1, T):
-        # 이전 상태 값에 패널티 적용
-        trans = dp[t-1][:, None] - switch_penalty
-        stay_or_switch = np.maximum(
-            trans.max(axis=0), dp[t-1])  # stay vs switch
-        best_prev = np.argmax(trans, axis=0)
-        dp[t] = score_matrix[t] + stay_or_switch
-        back[t] = np.where(dp[t-1] >= trans.max(axis=0),
-                           np.arange(N), best_prev)
-
-    path = np.zeros(T, dtype=int)
-    path[-1] = np.argmax(dp[-1])
-    for t in range(T-2, -1, -1):
-        path[t] = back[t+1, path[t+1]]
-    return path
-
-
-def merge_segments(idx_path, chord_names, times, min_dur=0.5):
-    """프레임별 인덱스를 타임라인으로 병합"""
-    segs = []
-    start = 0
-    cur = idx_path[0]
-    limit = min(len(idx_path), len(times))  # 인덱스 초과 방지
-
-    for i in range(1, limit):
-        if idx_path[i] != cur:
-            if i >= len(times) or start >= len(times):
-                continue  # 안전하게 스킵
-            dur = float(times[i] - times[start])
-            if dur >= min_dur:
-                segs.append({
-                    "chord": chord_names[cur],
-                    "timestamp": float(times[start]),
-                    "duration": dur
-                })
-            start = i
-            cur = idx_path[i]
-
-    # 마지막 세그먼트 처리
-    if start < len(times) and (limit - 1) < len(times):
-        dur = float(times[limit - 1] - times[start])
-        if dur >= min_dur:
-            segs.append({
-                "chord": chord_names[cur],
-                "timestamp": float(times[start]),
-                "duration": dur
-            })
-    return segs
-
-
-def estimate_key_from_chords(chords):
-    """추출된 코드들의 루트 다수결로 키 추정(간단버전)"""
-    roots = [c.replace("m", "") for c in chords]
-    if not roots:
-        return "C"
-    return max(set(roots), key=roots.count)
-# ---- /추가 ----
-
-
-def download_audio_from_youtube(video_url: str, out_dir: str) -> str:
-    tmp_id = uuid.uuid4().hex
-    out_tmpl = os.path.join(out_dir, f"{tmp_id}.%(ext)s")
-
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "outtmpl": out_tmpl,
-        "noplaylist": True,
-        "quiet": True,
-        "postprocessors": [{
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192",
-        }],
-        "extractor_args": {"youtube": {"player_client": ["android"]}},
-        "http_headers": {"User-Agent": "Mozilla/5.0"},
-        # ↓ 디버깅용 옵션(필요시 켜기)
-        # "verbose": True,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(video_url, download=True)
-        pre_path = ydl.prepare_filename(info)
-        final_path = str(Path(pre_path).with_suffix(".mp3"))
-
-    # 혹시 mp3가 다른 이름으로 생겼는지 확인
-    if not os.path.exists(final_path):
-        candidates = list(Path(out_dir).glob(f"{tmp_id}*.mp3"))
-        if candidates:
-            final_path = str(candidates[0])
-
-    size = os.path.getsize(final_path) if os.path.exists(final_path) else 0
-    logging.info(f"[yt-dlp] saved: {final_path} ({size/1024:.1f} KB)")
-
-    if size < 50_000:  # 50KB 미만이면 실패로 판단
-        raise ValueError("Downloaded audio seems invalid/too small.")
-
-    return final_path
-
-
-def safe_load_audio(path, duration=60):
-    if not os.path.exists(path) or os.path.getsize(path) < 2048:
-        raise ValueError("Audio file missing or too small.")
-    y, sr = librosa.load(path, mono=True, duration=duration)
-    if y.size == 0:
-        raise ValueError("Empty audio array.")
-    return y, sr
-
-
-def safe_tempo(y, sr):
-    try:
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        return 120 if (tempo is None or np.isnan(tempo) or tempo == 0) else float(tempo)
-    except Exception:
-        return 120
-
-
-def safe_key(y, sr):
-    try:
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        prof = np.mean(chroma, axis=1)
-        idx = int(np.argmax(prof))
-        return KEYS[idx]
-    except Exception:
-        return 'C'
-
-
-def analyze_audio_for_chords(audio_path):
-    """오디오에서 코드/타임라인 추출 (librosa만 사용)"""
-    try:
-        y, sr = safe_load_audio(audio_path, duration=60)
-        # ───── RMS 정규화 (볼륨 편차 줄이기) ─────
-        y = y / (np.sqrt(np.mean(y**2)) + 1e-6)
-
-        # 1) 하모닉/퍼커시브 분리 → 하모닉만 사용
-        y_h, _ = librosa.effects.hpss(y)
-
-        # 2) 비트 트래킹
-        tempo_raw, beat_frames = librosa.beat.beat_track(y=y_h, sr=sr)
-
-        # tempo를 확실히 float로 변환
-        # round, float 변환
-        tempo_val = float(np.asarray(tempo_raw).reshape(-1)[0])
-        # 너무 작으면 ×2, 너무 크면 ÷2
-        if tempo_val < 60:
-            tempo_val *= 2
-        elif tempo_val > 200:
-            tempo_val /= 2
-        tempo_val = max(40, min(tempo_val, 300))
-        if math.isnan(tempo_val) or tempo_val <= 0:
-            tempo_val = 120
-
-        # ★추가★ 비트 프레임 -> 시간(초)
-        beat_times = librosa.frames_to_time(beat_frames, sr=sr)
-
-        # 3) 크로마 CENS (노이즈에 더 강함) + 비트 싱크
-        chroma = librosa.feature.chroma_cens(y=y_h, sr=sr, hop_length=512)
-        chroma_sync = librosa.util.sync(
-            chroma, beat_frames, aggregate=np.median).T  # (T, 12)
-
-        # 4) 템플릿 매칭
-        chord_names, templates = build_chord_templates()
-        # cosine 유사도
-        norm_chroma = chroma_sync / \
-            (np.linalg.norm(chroma_sync, axis=1, keepdims=True) + 1e-9)
-        norm_temp = templates / \
-            (np.linalg.norm(templates, axis=1, keepdims=True) + 1e-9)
-        sims = norm_chroma @ norm_temp.T
-        # ───── Gaussian으로 시간축 평활화 ─────
-        sims = gaussian_filter1d(sims, sigma=1.0, axis=0)
-
-        # 5) Viterbi로 연속성 보정
-        path = viterbi_decode(sims, switch_penalty=0.15)
-
-        # 6) 타임라인 병합
-        chord_segments = merge_segments(
-            path, chord_names, beat_times, min_dur=0.5)
-
-        # 7) 키 추정
-        est_key = estimate_key_from_chords(
-            [seg["chord"] for seg in chord_segments])
-
-        # 8) 코드 다이어그램
-        unique = list(dict.fromkeys([seg["chord"] for seg in chord_segments]))
-        chord_charts = [CHORD_CHARTS.get(
-            c, CHORD_CHARTS["C"]) for c in unique if c in CHORD_CHARTS]
-
-        return {
-            "bpm": int(round(tempo_val)),
-            "signature": "4/4",
-            "key": f"{est_key} Major",
-            "chords": chord_segments,
-            "chordCharts": chord_charts
-        }
-    except Exception as e:
-        logging.exception(f"Audio analysis failed: {e}")
-        raise
+# 코드 진행 검색 인덱스 (analyzed_songs 로부터 재구성, 저장 시 증분 갱신)
+chord_index = ChordIndex()
+# 곡 유사도 추천 인덱스 (mmap 로드, 증분 추가)
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", os.path.join("data", "song_vectors"))
+song_vectors = SongVectorIndex(VECTOR_INDEX_PATH)
+
+# 1 이면 /analyze 를 analysis_jobs 큐에 넣고 분석 워커(worker.py) 결과를 기다림
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "0") == "1"
+JOB_WAIT_TIMEOUT = int(os.getenv("JOB_WAIT_TIMEOUT", 600))
+INDEX_SYNC_INTERVAL = 5
+INDEX_SYNC_BATCH = 1000
+INDEX_SYNC_OVERLAP = 5     # 초, 늦게 커밋된 행을 놓치지 않도록 다시 읽는 구간
+
+# 1 이면 예전 파이프라인 버전 분석 결과를 백그라운드로 재분석
+REANALYZE_ENABLED = os.getenv("REANALYZE_ENABLED", "0") == "1"
+REANALYZE_CPU_BUDGET = float(os.getenv("REANALYZE_CPU_BUDGET", 0.25))
+
+# 분석 동시 실행 수 / 검색 결과 미리 분석 설정
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", 2))
+ANALYZE_TIMEOUT = 600
+PREFETCH_MAX_IDS = 10
+PREFETCH_RESULT_TTL = 1800
+PREFETCH_MAX_QUEUE = 30         # 대기 가능한 미리 분석 작업 수
+PREFETCH_QUEUE_TTL = 600        # 작업 큐 모드: 이보다 오래 대기한 미리 분석은 취소
+PREFETCH_SWEEP_INTERVAL = 30
+JOB_SHED_BACKLOG = int(os.getenv("JOB_SHED_BACKLOG", 4))
+# 1 이면 시작할 때 합성 클립으로 분석 파이프라인을 미리 돌려 JIT 컴파일을 끝내 둠
+ANALYSIS_WARMUP = os.getenv("ANALYSIS_WARMUP", "1") == "1"
+prefetch_metrics = PrefetchMetrics()
+
+# YouTube 검색/영상 정보는 서버에서 캐시해서 제공 (키가 없으면 /search, /videos 비활성)
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 600))
+VIDEO_CACHE_TTL = int(os.getenv("VIDEO_CACHE_TTL", 86400))
+metadata = None
+if YOUTUBE_API_KEY:
+    metadata = MetadataService(YouTubeDataClient(YOUTUBE_API_KEY),
+                               search_ttl=SEARCH_CACHE_TTL, video_ttl=VIDEO_CACHE_TTL)
 
 
 @app.route("/download", methods=["POST"])
@@ -303,6 +93,7 @@ def download_audio():
     }
 
     try:
+        import yt_dlp
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             ydl.download([video_url])
         return jsonify({"file": output_path})
@@ -320,14 +111,478 @@ def analyze_song():
         video_url = f"https://www.youtube.com/watch?v={video_id}"
     if not video_url:
         return jsonify({"error": "videoId or url is required"}), 400
+    if video_id is not None and not valid_video_id(video_id):
+        return jsonify({"error": "invalid videoId"}), 400
+
+    if video_id:
+        try:
+            record_song_request(video_id)
+        except Exception as e:
+            app.logger.warning(f"Failed to record song request: {e}")
+        # 현재 파이프라인 버전으로 이미 저장된 곡은 다시 다운로드/분석하지 않음
+        stored = stored_analysis(video_id)
+        if stored is not None:
+            return jsonify(stored)
+
+    if JOB_QUEUE_ENABLED and video_id:
+        return analyze_via_job_queue(video_id)
+
+    # 미리 분석 중이던 작업이 막 취소된 경우에 대비해 한 번 더 시도
+    for _ in range(2):
+        task = scheduler.submit(video_url, INTERACTIVE, video_id=video_id)
+        if not task.wait(ANALYZE_TIMEOUT):
+            return jsonify({"error": "analysis timed out"}), 504
+        if task.state != "cancelled":
+            break
+    if task.state != "done":
+        return jsonify({"error": task.error or "analysis failed"}), 500
+    return jsonify(task.result)
+
+
+def run_analysis_task(task):
+    """스케줄러 작업: 다운로드 → (취소 확인) → 분석 → 저장/색인"""
+    analysis = audio_pipeline()
+    video_id = task.video_id
+    audio_path = None
+    if not (video_id and analysis.load_cached_features(video_id) is not None):
+        audio_path = analysis.download_audio_from_youtube(task.key, OUTPUT_DIR)
+    task.check_cancelled()
+    result, features = analysis.analyze_audio_for_chords(
+        audio_path, with_features=True, cache_key=video_id)
+    if video_id and save_analysis_to_db(
+            video_id, result, audio_path, features, PIPELINE_VERSION,
+            metadata=lookup_video(video_id)):
+        index_analysis(video_id, result, features)
+    return result
+
+
+def stored_analysis(video_id):
+    """현재 PIPELINE_VERSION 으로 저장된 분석 결과, 없으면(또는 DB 오류면) None"""
+    try:
+        return load_current_analysis(video_id, PIPELINE_VERSION)
+    except Exception as e:
+        app.logger.warning(f"Stored analysis lookup failed: {e}")
+        return None
+
+
+def lookup_video(video_id):
+    """저장용 영상 정보 — 보통 검색 때 채워진 캐시에서, 없으면 다른 요청과 묶어서 조회"""
+    if metadata is None:
+        return None
+    try:
+        return metadata.get_video(video_id)
+    except Exception as e:
+        app.logger.warning(f"Video metadata lookup failed: {e}")
+        return None
+
+
+def audio_pipeline():
+    """
+    librosa / scipy / yt_dlp 를 끌어오는 analysis 모듈을 처음 쓸 때 import.
+    인증·검색·추천 같은 라우트는 오디오 스택을 전혀 올리지 않는다.
+    """
+    import analysis
+    return analysis
+
+
+def warm_up_analysis():
+    """서버 시작 직후 합성 클립으로 분석 파이프라인 예열 (lazy import + numba JIT)"""
+    try:
+        elapsed = audio_pipeline().warm_up()
+        logging.info(f"[startup] analysis warm-up done in {elapsed:.2f}s "
+                     f"({time.perf_counter() - STARTED_AT:.2f}s after start)")
+    except Exception as e:
+        logging.warning(f"[startup] analysis warm-up failed: {e}")
+
+
+def index_analysis(video_id, analysis_result, features=None):
+    """저장된 분석 결과를 코드 진행/추천 인덱스에 반영"""
+    chord_index.add_song(
+        video_id, analysis_result.get('chords', []), analysis_result.get('key'))
+    if features is not None:
+        song_vectors.add(video_id, features)
+
+
+def analyze_via_job_queue(video_id):
+    """작업 큐에 등록하고 워커가 끝낼 때까지 대기"""
+    try:
+        recent = jobs.find_recent_result(video_id, PREFETCH_RESULT_TTL)
+        if recent is not None:
+            if recent["hit"]:
+                prefetch_metrics.incr("hit_ready")
+            return jsonify(recent["result"])
+
+        job_id, promoted = jobs.enqueue_job(video_id)
+        if promoted:
+            prefetch_metrics.incr("hit_inflight")
+        shed = jobs.shed_preview_jobs(JOB_SHED_BACKLOG)
+        if shed:
+            prefetch_metrics.incr("cancelled", shed)
+        deadline = time.monotonic() + JOB_WAIT_TIMEOUT
+        delay = 0.2
+        while time.monotonic() < deadline:
+            job = jobs.get_job(job_id)
+            if job["status"] == "done":
+                return jsonify(job["result"])
+            if job["status"] == "failed":
+                return jsonify({"error": job["error"] or "analysis failed"}), 500
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2.0)
+        return jsonify({"error": "analysis timed out", "jobId": job_id}), 504
+    except Exception as e:
+        app.logger.exception("Analyze (job queue) failed")
+        return jsonify({"error": str(e)}), 500
+
+
+def attach_metadata(video_ids):
+    """
+    분석 워커는 영상 정보를 모르므로 임시 제목으로 저장된 곡을 캐시의 실제 제목으로 교체.
+    인덱스 동기화가 새 행을 읽을 때 호출 — /analyze, /prefetch, POST /jobs 어느 경로로 분석됐든 적용된다.
+    보통 검색 때 채워진 캐시에 있고, 없는 곡만 50개씩 묶어서 조회한다.
+    """
+    if metadata is None or not video_ids:
+        return
+    try:
+        found = metadata.get_videos(video_ids)
+    except Exception as e:
+        logging.warning(f"[index-sync] video metadata lookup failed: {e}")
+        return
+    for video_id, meta in found.items():
+        try:
+            update_song_metadata(video_id, meta)
+        except Exception as e:
+            logging.warning(f"[index-sync] failed to update song metadata: {e}")
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """분석 작업 등록 (결과는 GET /jobs/<id> 로 확인)"""
+    data = request.get_json(silent=True) or {}
+    video_id = data.get("videoId")
+    if not video_id:
+        return jsonify({"error": "videoId is required"}), 400
+    if not valid_video_id(video_id):
+        return jsonify({"error": "invalid videoId"}), 400
+    try:
+        job_id, _ = jobs.enqueue_job(video_id)
+        return jsonify({"jobId": job_id}), 202
+    except Exception as e:
+        app.logger.exception("Enqueue failed")
+        return jsonify({"error": str(e)}), 500
+
 
+@app.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job_status(job_id):
     try:
-        audio_path = download_audio_from_youtube(video_url, OUTPUT_DIR)
-        result = analyze_audio_for_chords(audio_path)
-        return jsonify(result)
+        job = jobs.get_job(job_id)
     except Exception as e:
-        app.logger.exception("Analyze failed")
+        app.logger.exception("Job lookup failed")
         return jsonify({"error": str(e)}), 500
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/prefetch", methods=["POST"])
+def prefetch_songs():
+    """
+    검색 결과 곡들을 남는 자원으로 미리 분석 (PREVIEW 우선순위)
+    body: {"videoIds": [...]} (최대 10개)
+    """
+    data = request.get_json(silent=True) or {}
+    video_ids = [v for v in (data.get("videoIds") or [])
+                 if valid_video_id(v)][:PREFETCH_MAX_IDS]
+    # 현재 버전으로 이미 분석된 곡은 /analyze 가 저장된 결과를 바로 돌려주므로 건너뜀
+    try:
+        current = fetch_current_songs(video_ids, PIPELINE_VERSION)
+    except Exception as e:
+        app.logger.warning(f"Prefetch lookup failed: {e}")
+        current = set()
+    if current:
+        prefetch_metrics.incr("requested", len(current))
+        prefetch_metrics.incr("skipped", len(current))
+        video_ids = [v for v in video_ids if v not in current]
+
+    if JOB_QUEUE_ENABLED:
+        return prefetch_via_job_queue(video_ids)
+
+    accepted = 0
+    for video_id in video_ids:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        if scheduler.submit(video_url, PREVIEW, video_id=video_id) is not None:
+            accepted += 1
+    return jsonify({"accepted": accepted}), 202
+
+
+def prefetch_via_job_queue(video_ids):
+    """PREVIEW 작업으로 등록 (대기 중인 PREVIEW 가 PREFETCH_MAX_QUEUE 개면 버림)"""
+    prefetch_metrics.incr("requested", len(video_ids))
+    accepted = 0
+    try:
+        room = PREFETCH_MAX_QUEUE - jobs.count_queued_previews()
+        for video_id in video_ids[:max(room, 0)]:
+            jobs.enqueue_job(video_id, priority=jobs.PRIORITY_PREVIEW)
+            accepted += 1
+    except Exception as e:
+        app.logger.warning(f"Prefetch enqueue failed: {e}")
+    prefetch_metrics.incr("queued", accepted)
+    prefetch_metrics.incr("dropped", len(video_ids) - accepted)
+    return jsonify({"accepted": accepted}), 202
+
+
+def expire_prefetch_jobs():
+    """작업 큐 모드: 오래 대기한 미리 분석 취소 + 쓰이지 않고 만료된 결과 집계"""
+    while True:
+        time.sleep(PREFETCH_SWEEP_INTERVAL)
+        try:
+            cancelled, wasted = jobs.expire_preview_jobs(
+                PREFETCH_QUEUE_TTL, PREFETCH_RESULT_TTL)
+        except Exception as e:
+            logging.warning(f"[prefetch] expire failed: {e}")
+            continue
+        prefetch_metrics.incr("cancelled", cancelled)
+        prefetch_metrics.incr("wasted", wasted)
+
+
+@app.route("/metrics/prefetch", methods=["GET"])
+def get_prefetch_metrics():
+    """미리 분석 적중(hit_ready/hit_inflight) vs 낭비(wasted/cancelled) 통계"""
+    stats = prefetch_metrics.snapshot()
+    stats["mode"] = "job-queue" if JOB_QUEUE_ENABLED else "in-process"
+    if not JOB_QUEUE_ENABLED:
+        stats["scheduler"] = scheduler.stats()
+        return jsonify(stats)
+    # 작업 큐 모드: 완료/실패는 워커가 기록하므로 이 프로세스가 뜬 뒤 등록된 작업을 DB 에서 집계
+    try:
+        stats.update(jobs.preview_job_counts(time.perf_counter() - STARTED_AT))
+    except Exception as e:
+        app.logger.warning(f"Failed to count preview jobs: {e}")
+    return jsonify(stats)
+
+
+@app.route("/search", methods=["GET"])
+def search_videos():
+    """
+    YouTube 검색 (서버 캐시)
+    q:         검색어
+    pageToken: 다음 페이지 토큰 (선택)
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if metadata is None:
+        return jsonify({"error": "YOUTUBE_API_KEY is not configured"}), 503
+    try:
+        return jsonify(metadata.search(query, request.args.get("pageToken", "")))
+    except Exception as e:
+        app.logger.exception("YouTube search failed")
+        return jsonify({"error": str(e)}), 502
+
+
+@app.route("/videos", methods=["GET"])
+def get_videos():
+    """영상 정보 여러 개 (ids: 쉼표로 구분, 최대 50개)"""
+    ids = [v for v in request.args.get("ids", "").split(",") if valid_video_id(v)][:50]
+    if not ids:
+        return jsonify({"error": "ids is required"}), 400
+    if metadata is None:
+        return jsonify({"error": "YOUTUBE_API_KEY is not configured"}), 503
+    try:
+        found = metadata.get_videos(ids)
+    except Exception as e:
+        app.logger.exception("YouTube videos lookup failed")
+        return jsonify({"error": str(e)}), 502
+    return jsonify({"items": [found[v] for v in ids if v in found]})
+
+
+@app.route("/videos/<video_id>", methods=["GET"])
+def get_video(video_id):
+    if not valid_video_id(video_id):
+        return jsonify({"error": "invalid videoId"}), 400
+    if metadata is None:
+        return jsonify({"error": "YOUTUBE_API_KEY is not configured"}), 503
+    try:
+        video = metadata.get_video(video_id)
+    except Exception as e:
+        app.logger.exception("YouTube video lookup failed")
+        return jsonify({"error": str(e)}), 502
+    if video is None:
+        return jsonify({"error": "video not found"}), 404
+    return jsonify(video)
+
+
+@app.route("/metrics/metadata", methods=["GET"])
+def get_metadata_metrics():
+    """검색/영상 정보 캐시 적중, 요청 병합, upstream 호출 수"""
+    if metadata is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(metadata.stats(), enabled=True))
+
+
+def sync_indexes_from_db(since):
+    """
+    다른 프로세스(분석 워커, reanalyze.py)가 저장한 결과를 주기적으로 인덱스에 반영.
+    updated_at 은 초 단위이고 늦게 커밋된 트랜잭션은 더 이른 시각을 가질 수 있으므로,
+    매번 마지막으로 본 시각보다 INDEX_SYNC_OVERLAP 초 앞에서부터 다시 읽고 이미 반영한 행은 건너뛴다.
+    반영한 위치는 song_vectors 에 기록되어 재시작 후에도 그 근처부터 읽는다.
+    """
+    overlap = datetime.timedelta(seconds=INDEX_SYNC_OVERLAP)
+    applied = {}        # 겹치는 구간에서 이미 반영한 행: id -> updated_at
+    while True:
+        cursor = (since - overlap, 0)
+        while True:
+            try:
+                rows = fetch_songs_updated_since(*cursor, INDEX_SYNC_BATCH)
+            except Exception as e:
+                logging.warning(f"[index-sync] failed: {e}")
+                break
+            untitled = []
+            for row_id, video_id, title, song_key, chords, vec, updated_at in rows:
+                cursor = (updated_at, row_id)
+                since = max(since, updated_at)
+                if applied.get(row_id) == updated_at:
+                    continue
+                applied[row_id] = updated_at
+                if title == placeholder_title(video_id):
+                    untitled.append(video_id)
+                chord_index.add_song(video_id, chords, song_key)
+                if vec:
+                    vec = np.frombuffer(bytes(vec), dtype=np.float32)
+                    current = song_vectors.get(video_id)
+                    if current is None or not np.array_equal(current, vec):
+                        song_vectors.add(video_id, vec)
+            attach_metadata(untitled)
+            # 한 번에 다 못 읽었으면 쉬지 않고 이어서
+            if len(rows) < INDEX_SYNC_BATCH:
+                break
+        song_vectors.mark_synced(since, 0)
+        applied = {rid: ts for rid, ts in applied.items() if ts >= since - overlap}
+        time.sleep(INDEX_SYNC_INTERVAL)
+
+
+def load_indexes():
+    """서버 시작 시 저장된 분석 결과로 인덱스 구성 후 DB 변경을 계속 반영 (백그라운드)"""
+    try:
+        since = db_now()
+    except Exception as e:
+        logging.warning(f"[index-sync] disabled: {e}")
+        since = None
+    try:
+        chord_index.load_from_db(get_db_connection)
+    except Exception as e:
+        logging.warning(f"[chord-index] load failed: {e}")
+    try:
+        # 동기화 위치가 없는 예전 파일은 믿지 않고 DB 에서 다시 만듦
+        if not song_vectors.load() or song_vectors.synced is None:
+            song_vectors.load_from_db(get_db_connection)
+    except Exception as e:
+        logging.warning(f"[song-vectors] load failed: {e}")
+    if since is None:
+        return
+    # 파일 저장 이후 DB 에서 바뀐 행(재분석, 서버가 꺼져 있던 동안 워커가 저장한 곡)부터 다시 읽음
+    if song_vectors.synced is not None:
+        since = min(since, song_vectors.synced[0])
+    sync_indexes_from_db(since)
+
+
+@app.route("/chords/search", methods=["GET"])
+def search_chord_progression():
+    """
+    코드 진행으로 곡 검색
+    q:     "I-V-vi-IV" (모든 키) 또는 "Em-C-G-D" (입력한 키 그대로)
+    key:   곡 키 필터 (선택)
+    limit: 최대 결과 수 (기본 20, 최대 100)
+    """
+    query = request.args.get("q", "")
+    song_key = request.args.get("key")
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        codes, absolute = parse_progression(query)
+        results = chord_index.search(
+            codes, absolute=absolute, song_key=song_key, limit=limit)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "query": query,
+        "mode": "absolute" if absolute else "relative",
+        "results": results
+    })
+
+
+@app.route("/recommendations/<video_id>", methods=["GET"])
+def get_recommendations(video_id):
+    """코드 진행/크로마 특징 벡터가 비슷한 곡 추천 (k: 기본 10, 최대 50)"""
+    if not valid_video_id(video_id):
+        return jsonify({"error": "invalid videoId"}), 400
+    try:
+        k = max(1, min(int(request.args.get("k", 10)), 50))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+
+    vec = song_vectors.get(video_id)
+    if vec is None:
+        return jsonify({"error": "분석된 곡이 아닙니다"}), 404
+    neighbours = song_vectors.query(vec, k=k, exclude=video_id)
+
+    meta = {}
+    if neighbours:
+        try:
+            with get_db_connection() as connection:
+                cursor = connection.cursor()
+                placeholders = ", ".join(["%s"] * len(neighbours))
+                cursor.execute(
+                    "SELECT video_id, title, channel_title, thumbnail_url FROM analyzed_songs "
+                    f"WHERE video_id IN ({placeholders})", [vid for vid, _ in neighbours])
+                meta = {row[0]: row[1:] for row in cursor.fetchall()}
+        except Exception as e:
+            app.logger.warning(f"Failed to load recommendation metadata: {e}")
+
+    items = []
+    for vid, score in neighbours:
+        title, channel_title, thumbnail_url = meta.get(vid, (
+            "", "", f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg"))
+        items.append({
+            "videoId": vid,
+            "title": title,
+            "channelTitle": channel_title,
+            "thumbnailUrl": thumbnail_url,
+            "score": round(score, 4)
+        })
+    return jsonify({"videoId": video_id, "items": items})
+
+
+# 작업 큐 모드에서도 videoId 없이 url 만 온 /analyze 는 이 프로세스에서 분석
+scheduler = AnalysisScheduler(
+    run_analysis_task, workers=ANALYSIS_WORKERS, max_preview_queue=PREFETCH_MAX_QUEUE,
+    result_ttl=PREFETCH_RESULT_TTL, metrics=prefetch_metrics)
+
+
+def start_background_services():
+    """분석 스케줄러, 인덱스 로드/동기화, 미리 분석 정리, 재분석, 분석 예열 스레드 시작 (프로세스당 한 번)"""
+    scheduler.start()
+    song_vectors.register_atexit()
+    threading.Thread(target=load_indexes, daemon=True).start()
+    if JOB_QUEUE_ENABLED:
+        threading.Thread(target=expire_prefetch_jobs, daemon=True).start()
+    if REANALYZE_ENABLED:
+        from reanalyze import Reanalyzer
+        Reanalyzer(REANALYZE_CPU_BUDGET, on_update=index_analysis).start()
+    if not JOB_QUEUE_ENABLED and ANALYSIS_WARMUP:
+        threading.Thread(target=warm_up_analysis, daemon=True).start()
+
+
+# python main.py (debug=True) 는 Werkzeug 리로더가 감시 프로세스와 서빙 자식 프로세스 둘 다에서
+# 이 모듈을 실행한다. 감시 프로세스에서는 요청을 받지 않으므로 백그라운드 작업을 띄우지 않음
+# (재분석이 두 번 돌거나 두 프로세스가 같은 인덱스 파일을 동시에 쓰는 것을 막음)
+IS_RELOADER_WATCHER = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+if not IS_RELOADER_WATCHER:
+    start_background_services()
+logging.info(f"[startup] app ready in {time.perf_counter() - STARTED_AT:.2f}s")
 
 
 if __name__ == "__main__":
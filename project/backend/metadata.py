@@ -0,0 +1,268 @@
+# metadata.py
+"""YouTube 검색 / 영상 메타데이터 서비스
+
+브라우저마다 YouTube Data API 를 직접 부르던 것을 서버 한 곳으로 모은다.
+- 검색 결과 TTL 캐시 (검색어 + pageToken 단위)
+- 영상 메타데이터 TTL 캐시 — 검색 결과로 채우고, 없는 것만 50개씩 묶어서 조회
+- 같은 요청이 동시에 들어오면 upstream 호출은 한 번만 (request coalescing)
+upstream 클라이언트는 search()/videos() 만 있으면 되므로 테스트에서는 가짜로 바꿔 끼울 수 있다.
+"""
+import re
+import json
+import time
+import logging
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+MAX_BATCH = 50              # videos.list 한 번에 조회 가능한 최대 ID 수
+BATCH_WINDOW = 0.02         # 배치를 모으는 시간(초)
+MISSING_TTL = 600           # 없는(삭제/비공개) 영상을 기억하는 시간(초)
+
+
+def valid_video_id(video_id):
+    """YouTube 영상 ID 형식(11자)인지 — 경로/URL/SQL 에 쓰기 전에 라우트에서 확인"""
+    return isinstance(video_id, str) and bool(VIDEO_ID_RE.match(video_id))
+
+
+class YouTubeDataClient:
+    """YouTube Data API v3 (upstream). 응답 JSON 을 그대로 반환"""
+
+    BASE_URL = "https://www.googleapis.com/youtube/v3"
+
+    def __init__(self, api_key, timeout=10):
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _get(self, path, params):
+        params = dict(params, key=self.api_key)
+        url = f"{self.BASE_URL}/{path}?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=self.timeout) as res:
+            return json.loads(res.read().decode("utf-8"))
+
+    def search(self, query, page_token="", max_results=10):
+        params = {"part": "snippet", "type": "video",
+                  "maxResults": max_results, "q": query}
+        if page_token:
+            params["pageToken"] = page_token
+        return self._get("search", params)
+
+    def videos(self, video_ids):
+        return self._get("videos", {"part": "snippet,contentDetails",
+                                    "id": ",".join(video_ids)})
+
+
+def _thumbnail(snippet, video_id):
+    thumbs = snippet.get("thumbnails") or {}
+    for size in ("high", "medium", "default"):
+        if size in thumbs:
+            return thumbs[size]["url"]
+    return f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+
+
+def _song(video_id, snippet):
+    return {
+        "videoId": video_id,
+        "title": snippet.get("title", ""),
+        "channelTitle": snippet.get("channelTitle", ""),
+        "thumbnailUrl": _thumbnail(snippet, video_id),
+    }
+
+
+class TTLCache:
+    """크기 제한이 있는 LRU + TTL 캐시"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MetadataService:
+    """
+    client:       search()/videos() 를 가진 upstream (기본: YouTubeDataClient)
+    search_ttl:   검색 결과 캐시 시간(초)
+    video_ttl:    영상 메타데이터 캐시 시간(초)
+    missing_ttl:  upstream 에 없던 영상 ID 를 다시 묻지 않는 시간(초)
+    """
+
+    def __init__(self, client, search_ttl=600, video_ttl=86400,
+                 max_searches=2000, max_videos=100_000, missing_ttl=MISSING_TTL):
+        self.client = client
+        self._searches = TTLCache(search_ttl, max_searches)
+        self._videos = TTLCache(video_ttl, max_videos)
+        self._missing = TTLCache(missing_ttl, max_videos)
+        self._lock = threading.Lock()
+        self._inflight_search = {}       # (query, page_token) -> Future
+        self._pending_videos = {}        # video_id -> Future (아직 배치에 안 들어감)
+        self._inflight_videos = {}       # video_id -> Future (upstream 조회 중)
+        self._flush_timer = None
+        self._stats = dict.fromkeys(
+            ("search_hits", "search_coalesced", "search_upstream",
+             "video_hits", "video_missing_hits", "video_coalesced",
+             "video_upstream_calls", "video_upstream_ids"), 0)
+
+    def _incr(self, name, n=1):
+        self._stats[name] += n
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s["cached_searches"] = len(self._searches)
+        s["cached_videos"] = len(self._videos)
+        return s
+
+    # ---- 검색 ----
+    def search(self, query, page_token=""):
+        """{"items": [...], "nextPageToken": ...}"""
+        key = (" ".join(query.lower().split()), page_token or "")
+        cached = self._searches.get(key)
+        if cached is not None:
+            with self._lock:
+                self._incr("search_hits")
+            return cached
+
+        with self._lock:
+            future = self._inflight_search.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight_search[key] = future
+                self._incr("search_upstream")
+            else:
+                self._incr("search_coalesced")
+        if not leader:
+            return future.result()
+
+        try:
+            data = self.client.search(query, page_token)
+            items = [_song(it["id"]["videoId"], it.get("snippet", {}))
+                     for it in data.get("items", [])
+                     if it.get("id", {}).get("videoId")]
+            result = {"items": items, "nextPageToken": data.get("nextPageToken")}
+            self._searches.set(key, result)
+            # 검색 결과의 snippet 으로 영상 캐시도 채움 → 저장/상세 조회 때 추가 호출 없음
+            for song in items:
+                if self._videos.get(song["videoId"]) is None:
+                    self._videos.set(song["videoId"], song)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight_search.pop(key, None)
+
+    # ---- 영상 메타데이터 ----
+    def peek_video(self, video_id):
+        """캐시에 있을 때만 반환 (upstream 호출 없음)"""
+        return self._videos.get(video_id)
+
+    def get_video(self, video_id, timeout=15):
+        return self.get_videos([video_id], timeout).get(video_id)
+
+    def get_videos(self, video_ids, timeout=15):
+        """
+        {video_id: song} — 캐시에 없는 ID 는 다른 요청과 함께 50개 단위로 묶어서 조회.
+        존재하지 않는 영상은 결과에서 빠진다.
+        """
+        found, waits = {}, {}
+        with self._lock:
+            for vid in dict.fromkeys(video_ids):
+                cached = self._videos.get(vid)
+                if cached is not None:
+                    found[vid] = cached
+                    self._incr("video_hits")
+                    continue
+                if self._missing.get(vid) is not None:
+                    self._incr("video_missing_hits")
+                    continue
+                future = self._pending_videos.get(vid) or self._inflight_videos.get(vid)
+                if future is not None:
+                    self._incr("video_coalesced")
+                else:
+                    future = Future()
+                    self._pending_videos[vid] = future
+                waits[vid] = future
+            if len(self._pending_videos) >= MAX_BATCH:
+                # 꽉 찬 배치만 바로 보내고 나머지는 BATCH_WINDOW 동안 더 모음
+                self._start_flush(full_only=True)
+            if self._pending_videos and self._flush_timer is None:
+                self._flush_timer = threading.Timer(BATCH_WINDOW, self._timer_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+        for vid, future in waits.items():
+            song = future.result(timeout)
+            if song is not None:
+                found[vid] = song
+        return found
+
+    def _timer_flush(self):
+        with self._lock:
+            self._flush_timer = None
+            self._start_flush()
+
+    def _start_flush(self, full_only=False):
+        """
+        대기 중인 ID 를 50개씩 잘라 upstream 조회 (self._lock 을 잡은 상태에서 호출)
+        full_only: 50개가 안 되는 나머지는 남겨 둠
+        """
+        while self._pending_videos and not (
+                full_only and len(self._pending_videos) < MAX_BATCH):
+            batch = dict(list(self._pending_videos.items())[:MAX_BATCH])
+            for vid in batch:
+                del self._pending_videos[vid]
+            self._inflight_videos.update(batch)
+            self._incr("video_upstream_calls")
+            self._incr("video_upstream_ids", len(batch))
+            threading.Thread(target=self._fetch_batch, args=(batch,),
+                             daemon=True).start()
+
+    def _fetch_batch(self, batch):
+        try:
+            data = self.client.videos(list(batch))
+            songs = {it["id"]: _song(it["id"], it.get("snippet", {}))
+                     for it in data.get("items", [])}
+            for vid, song in songs.items():
+                self._videos.set(vid, song)
+            for vid, future in batch.items():
+                if vid not in songs:
+                    self._missing.set(vid, True)
+                future.set_result(songs.get(vid))
+        except Exception as e:
+            logging.warning(f"[metadata] videos lookup failed: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                for vid in batch:
+                    self._inflight_videos.pop(vid, None)
@@ -0,0 +1,127 @@
+# reanalyze.py
+"""
+파이프라인 버전이 바뀌었을 때 analyzed_songs 의 예전 분석 결과를 백그라운드로 갱신.
+
+- 인기순(request_count)으로 batch 단위 처리
+- 특징 캐시 → 저장된 오디오 → 다운로드 순으로 재사용
+- 한 행씩 UPSERT 하므로 읽기는 막히지 않음 (InnoDB MVCC)
+- cpu_budget(코어 1개 기준 비율) 을 넘지 않도록 작업 사이에 쉼
+
+    python reanalyze.py --cpu-budget 0.5
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+sys.path.append(os.path.join(os.path.dirname(__file__), 'db'))
+from songs import save_analysis_to_db, fetch_outdated_songs
+from analysis import (PIPELINE_VERSION, analyze_audio_for_chords,
+                      download_audio_from_youtube, load_cached_features)
+
+OUTPUT_DIR = "downloads"
+
+
+class Reanalyzer(threading.Thread):
+    """
+    cpu_budget: 0~1, 재분석이 쓸 CPU 시간 비율
+    on_update:  (video_id, result, features) 콜백 — 같은 프로세스의 인덱스 갱신용
+    whole_process: True 면 프로세스 전체 CPU 시간으로 계산 (단독 실행 — BLAS/리샘플러 스레드 포함).
+                   False(API 안의 스레드)면 이 스레드 CPU 시간만. 어느 쪽이든
+                   다운로드 때 yt-dlp 가 띄우는 ffmpeg 같은 자식 프로세스 CPU 시간은 더한다
+    """
+
+    def __init__(self, cpu_budget=0.25, batch_size=20, idle_seconds=300,
+                 on_update=None, whole_process=False):
+        super().__init__(daemon=True, name="reanalyzer")
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.on_update = on_update
+        self.whole_process = whole_process
+        self._failed = set()     # 이번 실행에서 실패한 곡은 다시 집지 않음
+        self._done = threading.Event()
+
+    def stop(self):
+        self._done.set()
+
+    def run(self):
+        logging.info(f"[reanalyze] started (version {PIPELINE_VERSION}, "
+                     f"cpu budget {self.cpu_budget:.0%})")
+        while not self._done.is_set():
+            try:
+                rows = fetch_outdated_songs(
+                    PIPELINE_VERSION, self.batch_size, self._failed)
+            except Exception as e:
+                logging.warning(f"[reanalyze] fetch failed: {e}")
+                rows = []
+            if not rows:
+                self._done.wait(self.idle_seconds)
+                continue
+            for video_id, file_path in rows:
+                if self._done.is_set():
+                    return
+                self._throttled(video_id, file_path)
+
+    def _cpu_time(self):
+        cpu = time.process_time() if self.whole_process else time.thread_time()
+        if resource is not None:
+            # 끝난(wait 된) 자식 프로세스 — 다운로드 후 ffmpeg mp3 변환
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu += children.ru_utime + children.ru_stime
+        return cpu
+
+    def _throttled(self, video_id, file_path):
+        """한 곡 처리 후, 사용한 CPU 시간에 비례해 쉼"""
+        cpu_start = self._cpu_time()
+        self.reanalyze_one(video_id, file_path)
+        used = self._cpu_time() - cpu_start
+        self._done.wait(used * (1.0 / self.cpu_budget - 1.0))
+
+    def reanalyze_one(self, video_id, file_path):
+        try:
+            audio_path = file_path
+            if load_cached_features(video_id) is None and not (
+                    file_path and os.path.exists(file_path)):
+                video_url = f"https://www.youtube.com/watch?v={video_id}"
+                audio_path = download_audio_from_youtube(video_url, OUTPUT_DIR)
+            result, features = analyze_audio_for_chords(
+                audio_path, with_features=True, cache_key=video_id)
+            if save_analysis_to_db(video_id, result, audio_path, features,
+                                   PIPELINE_VERSION):
+                if self.on_update:
+                    self.on_update(video_id, result, features)
+                logging.info(f"[reanalyze] {video_id} → v{PIPELINE_VERSION}")
+                return True
+        except Exception as e:
+            logging.warning(f"[reanalyze] {video_id} failed: {e}")
+        self._failed.add(video_id)
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="예전 파이프라인 버전 분석 결과 재분석")
+    parser.add_argument("--cpu-budget", type=float, default=0.5,
+                        help="사용할 CPU 비율 (코어 1개 기준, 0~1)")
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if hasattr(os, "nice"):
+        os.nice(10)
+    worker = Reanalyzer(args.cpu_budget, args.batch_size, whole_process=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(1.0)
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
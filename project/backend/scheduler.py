@@ -0,0 +1,239 @@
+# scheduler.py
+"""
+분석 작업 우선순위 스케줄러 (API 프로세스 내부 스레드 풀)
+
+- INTERACTIVE(/analyze) 는 항상 PREVIEW(검색 결과 미리 분석)보다 먼저 실행
+- 남는 워커가 없을 때 INTERACTIVE 가 들어오면 대기 중인 PREVIEW 는 취소,
+  실행 중인 PREVIEW 에는 취소 요청(다운로드 직후 확인)
+- 같은 곡은 하나의 작업으로 합쳐짐: 미리 분석 중인 곡을 클릭하면 그 작업을 승격해서 기다림
+- 끝난 결과는 잠시 보관해 두었다가 /analyze 에 바로 돌려줌
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+INTERACTIVE = 0
+PREVIEW = 1
+
+
+class AnalysisCancelled(Exception):
+    """실행 중이던 PREVIEW 작업이 부하 때문에 취소됨"""
+
+
+class AnalysisTask:
+    def __init__(self, key, priority, video_id=None):
+        self.key = key
+        self.video_id = video_id
+        self.priority = priority
+        self.speculative = priority == PREVIEW
+        self.state = "queued"          # queued / running / done / failed / cancelled
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.used = False              # 미리 분석한 결과를 실제 요청이 가져갔는지
+        self.finished_at = None
+        self._event = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def check_cancelled(self):
+        """작업 함수가 무거운 단계 사이에 호출"""
+        if self.cancel_requested:
+            raise AnalysisCancelled(self.key)
+
+    def _finish(self, state, result=None, error=None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        self._event.set()
+
+
+class PrefetchMetrics:
+    """미리 분석 적중/낭비 카운터"""
+
+    FIELDS = ("requested", "queued", "skipped", "dropped", "completed", "failed",
+              "cancelled", "hit_ready", "hit_inflight", "wasted")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            c = dict(self._counts)
+        hits = c["hit_ready"] + c["hit_inflight"]
+        settled = hits + c["wasted"] + c["cancelled"]
+        c["hit_rate"] = round(hits / settled, 3) if settled else None
+        return c
+
+
+class AnalysisScheduler:
+    """
+    run_fn(task) -> result : 실제 분석 함수 (다운로드 + 분석 + 저장)
+    workers:           동시에 실행할 분석 수
+    max_preview_queue: 대기 가능한 PREVIEW 작업 수
+    result_ttl:        끝난 결과 보관 시간(초)
+    """
+
+    def __init__(self, run_fn, workers=2, max_preview_queue=30,
+                 result_ttl=1800, max_results=500, metrics=None):
+        self.run_fn = run_fn
+        self.workers = workers
+        self.max_preview_queue = max_preview_queue
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.metrics = metrics or PrefetchMetrics()
+        self._cond = threading.Condition()
+        self._heap = []                   # (priority, seq, task)
+        self._seq = itertools.count()
+        self._inflight = {}               # key -> 대기/실행 중 task
+        self._results = OrderedDict()     # key -> 끝난 task (성공만)
+        self._running = 0
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, daemon=True,
+                                 name=f"analysis-{i}")
+            t.start()
+            self._threads.append(t)
+        return self
+
+    # ---- 제출 ----
+    def submit(self, key, priority=INTERACTIVE, video_id=None):
+        """작업 제출. PREVIEW 가 여유가 없어 버려지면 None"""
+        with self._cond:
+            self._expire_results()
+            if priority == INTERACTIVE:
+                return self._submit_interactive(key, video_id)
+            return self._submit_preview(key, video_id)
+
+    def _submit_interactive(self, key, video_id):
+        done = self._results.get(key)
+        if done is not None:
+            if done.speculative and not done.used:
+                self.metrics.incr("hit_ready")
+            done.used = True
+            return done
+
+        task = self._inflight.get(key)
+        if task is not None:
+            if task.speculative and not task.used:
+                self.metrics.incr("hit_inflight")
+            task.used = True
+            task.cancel_requested = False
+            if task.priority != INTERACTIVE:
+                task.priority = INTERACTIVE
+                if task.state == "queued":
+                    self._push(task)
+            return task
+
+        task = AnalysisTask(key, INTERACTIVE, video_id)
+        self._inflight[key] = task
+        self._push(task)
+        self._shed_previews()
+        return task
+
+    def _submit_preview(self, key, video_id):
+        self.metrics.incr("requested")
+        if key in self._results or key in self._inflight:
+            self.metrics.incr("skipped")
+            return self._results.get(key) or self._inflight.get(key)
+        queued_previews = sum(
+            1 for t in self._inflight.values()
+            if t.state == "queued" and t.priority == PREVIEW)
+        if queued_previews >= self.max_preview_queue or self._interactive_waiting():
+            self.metrics.incr("dropped")
+            return None
+
+        task = AnalysisTask(key, PREVIEW, video_id)
+        self._inflight[key] = task
+        self._push(task)
+        self.metrics.incr("queued")
+        return task
+
+    def _push(self, task):
+        heapq.heappush(self._heap, (task.priority, next(self._seq), task))
+        self._cond.notify()
+
+    def _interactive_waiting(self):
+        return any(t.state == "queued" and t.priority == INTERACTIVE
+                   for t in self._inflight.values())
+
+    def _shed_previews(self):
+        """남는 워커가 없으면 대기 중 PREVIEW 취소 + 실행 중 PREVIEW 에 취소 요청"""
+        if self._running < self.workers:
+            return
+        for task in list(self._inflight.values()):
+            if task.priority != PREVIEW or task.used:
+                continue
+            if task.state == "queued":
+                del self._inflight[task.key]
+                task._finish("cancelled")
+                self.metrics.incr("cancelled")
+            elif task.state == "running":
+                task.cancel_requested = True
+
+    # ---- 실행 ----
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    while not self._heap:
+                        self._cond.wait()
+                    priority, _, task = heapq.heappop(self._heap)
+                    # 승격/취소로 무효가 된 항목은 건너뜀
+                    if task.state == "queued" and priority == task.priority:
+                        break
+                task.state = "running"
+                self._running += 1
+
+            try:
+                result = self.run_fn(task)
+                state, error = "done", None
+            except AnalysisCancelled:
+                result, state, error = None, "cancelled", "cancelled"
+            except Exception as e:
+                logging.exception(f"[scheduler] {task.key} failed")
+                result, state, error = None, "failed", str(e)
+
+            with self._cond:
+                self._running -= 1
+                self._inflight.pop(task.key, None)
+                task._finish(state, result, error)
+                if task.speculative:
+                    self.metrics.incr({"done": "completed", "failed": "failed",
+                                       "cancelled": "cancelled"}[state])
+                if state == "done":
+                    self._results[task.key] = task
+                    self._results.move_to_end(task.key)
+                    self._expire_results()
+
+    def _expire_results(self):
+        now = time.monotonic()
+        while self._results:
+            key, task = next(iter(self._results.items()))
+            if (len(self._results) <= self.max_results
+                    and now - task.finished_at < self.result_ttl):
+                break
+            del self._results[key]
+            if task.speculative and not task.used:
+                self.metrics.incr("wasted")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": sum(1 for t in self._inflight.values() if t.state == "queued"),
+                "cachedResults": len(self._results),
+            }
@@ -0,0 +1,391 @@
+# song_vectors.py
+"""곡 유사도 추천용 특징 벡터 / 최근접 이웃 인덱스
+
+analyze_audio_for_chords 에서 이미 계산한 비트 싱크 크로마와 코드 타임라인으로
+곡마다 고정 길이(FEATURE_DIM) float32 벡터를 만들고,
+연속된 float32 행렬(.npy, mmap 로드) + IVF 리스트 + 메모리 증분 버퍼로 top-k 검색한다.
+"""
+import os
+import json
+import datetime
+import atexit
+import logging
+import threading
+import numpy as np
+
+KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# 벡터 구성 (모두 키 정규화: 곡 키 루트를 0으로 회전)
+#   0..23  코드 히스토그램 (상대 루트 12 × 장/단 2, 길이 가중)
+#  24..47  전이 히스토그램 (루트 간격 12 × 다음 코드 장/단 2)
+#  48..59  평균 크로마 프로파일
+#  60..63  템포(log2), 단조 코드 비율, 코드 변화율, 사용 코드 종류 수
+FEATURE_DIM = 64
+BLOCK_WEIGHTS = (1.0, 1.0, 0.7, 0.5)
+
+
+def _chord_root(name):
+    base = name[:-1] if name.endswith("m") else name
+    base = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#'}.get(base, base)
+    return KEYS.index(base) if base in KEYS else None, name.endswith("m")
+
+
+def _unit(v):
+    s = float(np.sum(v))
+    return v / s if s > 0 else v
+
+
+def build_feature_vector(chord_segments, chroma_sync, bpm, key_name):
+    """
+    chord_segments: merge_segments 결과
+    chroma_sync:    (T, 12) 비트 싱크 크로마
+    bpm:            템포
+    key_name:       'G' / 'G Major' 형태의 키
+    반환: L2 정규화된 (FEATURE_DIM,) float32 벡터 (내적 = 코사인 유사도)
+    """
+    key = _chord_root(str(key_name).split()[0])[0] or 0
+
+    chord_hist = np.zeros(24, dtype=np.float32)
+    trans_hist = np.zeros(24, dtype=np.float32)
+    prev = None
+    total_dur = 0.0
+    minor_dur = 0.0
+    for seg in chord_segments:
+        root, minor = _chord_root(seg["chord"])
+        if root is None:
+            continue
+        dur = float(seg.get("duration", 0.0))
+        rel = (root - key) % 12
+        chord_hist[rel * 2 + int(minor)] += dur
+        total_dur += dur
+        minor_dur += dur if minor else 0.0
+        if prev is not None and prev != (root, minor):
+            trans_hist[((root - prev[0]) % 12) * 2 + int(minor)] += 1
+        prev = (root, minor)
+
+    chroma = np.zeros(12, dtype=np.float32)
+    if chroma_sync is not None and len(chroma_sync):
+        chroma = np.roll(np.mean(chroma_sync, axis=0), -key).astype(np.float32)
+
+    distinct = int(np.count_nonzero(chord_hist))
+    changes = len(chord_segments)
+    scalars = np.array([
+        np.clip(np.log2(max(float(bpm), 1.0) / 120.0), -1.0, 1.0),
+        minor_dur / total_dur if total_dur > 0 else 0.0,
+        min(changes / total_dur, 2.0) / 2.0 if total_dur > 0 else 0.0,
+        distinct / 24.0,
+    ], dtype=np.float32)
+
+    blocks = (_unit(chord_hist), _unit(trans_hist), _unit(chroma), scalars)
+    vec = np.concatenate([b * w for b, w in zip(blocks, BLOCK_WEIGHTS)]).astype(np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def _kmeans(x, nlist, iters=8, seed=0):
+    """구면 k-means (코사인) — IVF 리스트 중심 학습"""
+    rng = np.random.default_rng(seed)
+    cent = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(x, cent)
+        sums = np.zeros_like(cent)
+        np.add.at(sums, labels, x)
+        empty = ~sums.any(axis=1)
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()))]
+        cent = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-9)
+    return cent.astype(np.float32)
+
+
+def _assign(x, cent, chunk=65536):
+    labels = np.empty(len(x), dtype=np.int32)
+    for i in range(0, len(x), chunk):
+        labels[i:i + chunk] = np.argmax(x[i:i + chunk] @ cent.T, axis=1)
+    return labels
+
+
+class SongVectorIndex:
+    """
+    <path>.npy      (N, FEATURE_DIM) float32 행렬 — mmap_mode='r' 로 로드
+    <path>.ids.json 행 번호 → video_id
+    <path>.ivf.npz  IVF 중심(centroids)과 리스트별 행 구간(offsets)
+    <path>.sync.json 파일에 반영된 analyzed_songs 의 마지막 (updated_at, id) — 시작 시 이후 행을 다시 읽음
+
+    곡이 IVF_MIN_ROWS 이상이면 행을 가장 가까운 중심별로 모아 저장하고,
+    질의는 가까운 nprobe 개 리스트의 연속 구간만 훑는다(그 미만이면 전수 검색).
+    새 벡터는 메모리 버퍼(_delta)에 쌓였다가 compact() 때 파일로 합쳐진다.
+    """
+
+    IVF_MIN_ROWS = 50_000
+
+    def __init__(self, path, dim=FEATURE_DIM, save_every=2000, nprobe=24):
+        self.path = path
+        self.dim = dim
+        self.save_every = save_every
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._saving = threading.Lock()
+        self._synced = None              # (updated_at, id) 까지의 DB 변경이 반영됨
+        self._saved_synced = None
+        self._set_base(np.zeros((0, dim), dtype=np.float32), [], None, None, 0)
+
+    def _set_base(self, base, ids, centroids, offsets, trained_rows):
+        self._base = base
+        self._base_ids = ids
+        self._deleted = np.zeros(len(ids), dtype=bool)   # 교체된 base 행
+        self._centroids = centroids
+        self._offsets = offsets
+        self._trained_rows = trained_rows
+        self._delta = []                                  # [(video_id, vec) | None]
+        self._delta_mat = None                            # _delta 를 쌓은 행렬 캐시
+        self._rows = {vid: ("base", i) for i, vid in enumerate(ids)}
+
+    @property
+    def _npy(self):
+        return self.path + ".npy"
+
+    @property
+    def _ids_path(self):
+        return self.path + ".ids.json"
+
+    @property
+    def _ivf_path(self):
+        return self.path + ".ivf.npz"
+
+    @property
+    def _sync_path(self):
+        return self.path + ".sync.json"
+
+    @property
+    def synced(self):
+        return self._synced
+
+    def mark_synced(self, updated_at, row_id):
+        """analyzed_songs 의 (updated_at, id) 까지 반영했음을 기록 (다음 save 때 파일에 저장)"""
+        with self._lock:
+            self._synced = (updated_at, row_id)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self):
+        """디스크의 인덱스를 mmap 으로 연다. 없거나 깨졌으면 False"""
+        if not (os.path.exists(self._npy) and os.path.exists(self._ids_path)):
+            return False
+        base = np.load(self._npy, mmap_mode="r")
+        with open(self._ids_path, "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        if base.ndim != 2 or base.shape != (len(ids), self.dim) or base.dtype != np.float32:
+            logging.warning("[song-vectors] index files mismatch, ignoring")
+            return False
+        centroids = offsets = None
+        trained_rows = 0
+        if os.path.exists(self._ivf_path):
+            ivf = np.load(self._ivf_path)
+            if int(ivf["offsets"][-1]) == len(ids):
+                centroids, offsets = ivf["centroids"], ivf["offsets"]
+                trained_rows = int(ivf["trained_rows"])
+        synced = None
+        if os.path.exists(self._sync_path):
+            with open(self._sync_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            synced = (datetime.datetime.fromisoformat(data["updated_at"]), int(data["id"]))
+        with self._lock:
+            self._set_base(base, ids, centroids, offsets, trained_rows)
+            self._synced = self._saved_synced = synced
+        logging.info(f"[song-vectors] mmap loaded {len(ids)} vectors")
+        return True
+
+    def add(self, video_id, vec):
+        """벡터 추가(이미 있으면 교체)"""
+        vec = np.asarray(vec, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            self._put(video_id, vec)
+            pending = len(self._delta)
+        if pending >= self.save_every and not self._saving.locked():
+            threading.Thread(target=self.save, daemon=True).start()
+
+    def _put(self, video_id, vec):
+        """delta 에 추가하고 예전 행(base/delta)은 지움 (self._lock 을 잡은 상태에서 호출)"""
+        old = self._rows.get(video_id)
+        if old is not None and old[0] == "base":
+            self._deleted[old[1]] = True
+        elif old is not None:
+            self._delta[old[1]] = None
+        self._rows[video_id] = ("delta", len(self._delta))
+        self._delta.append((video_id, vec))
+        self._delta_mat = None
+
+    def get(self, video_id):
+        with self._lock:
+            loc = self._rows.get(video_id)
+            if loc is None:
+                return None
+            if loc[0] == "base":
+                return np.array(self._base[loc[1]])
+            return self._delta[loc[1]][1]
+
+    def query(self, vec, k=10, exclude=None):
+        """코사인 유사도 상위 k개 [(video_id, score)]"""
+        q = np.asarray(vec, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            base, base_ids, deleted = self._base, self._base_ids, self._deleted
+            centroids, offsets = self._centroids, self._offsets
+            if self._delta_mat is None:
+                live = [e for e in self._delta if e is not None]
+                self._delta_mat = (
+                    np.stack([v for _, v in live]) if live else None,
+                    [vid for vid, _ in live])
+            delta_mat, delta_ids = self._delta_mat
+
+        scores, ids = [], []
+        if len(base) and centroids is not None:
+            probe = np.argsort(-(centroids @ q))[:self.nprobe]
+            for lst in probe:
+                a, b = int(offsets[lst]), int(offsets[lst + 1])
+                if a == b:
+                    continue
+                s = base[a:b] @ q
+                s[deleted[a:b]] = -np.inf
+                scores.append(s)
+                ids.append(np.arange(a, b))
+        elif len(base):
+            s = base @ q
+            s[deleted] = -np.inf
+            scores.append(s)
+            ids.append(np.arange(len(base)))
+        if delta_mat is not None:
+            scores.append(delta_mat @ q)
+            ids.append(np.arange(len(delta_ids)) + len(base_ids))
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+
+        want = min(k + 1, len(scores))
+        top = np.argpartition(-scores, want - 1)[:want]
+        top = top[np.argsort(-scores[top])]
+        out = []
+        for i in top:
+            if not np.isfinite(scores[i]):
+                continue
+            row = int(ids[i])
+            vid = base_ids[row] if row < len(base_ids) else delta_ids[row - len(base_ids)]
+            if vid != exclude:
+                out.append((vid, float(scores[i])))
+        return out[:k]
+
+    def save(self):
+        """
+        base + delta 를 새 파일로 합치고 원자적으로 교체한 뒤 다시 mmap.
+        무거운 작업은 락 밖에서 하고, 그동안 들어온 벡터는 새 delta 로 넘긴다.
+        """
+        with self._saving:
+            with self._lock:
+                synced = self._synced
+                if (not self._delta and not self._deleted.any()
+                        and synced == self._saved_synced):
+                    return
+                base, base_ids = self._base, self._base_ids
+                deleted = self._deleted.copy()
+                delta = list(self._delta)
+                centroids, offsets = self._centroids, self._offsets
+                trained_rows = self._trained_rows
+
+            keep = ~deleted
+            live = [e for e in delta if e is not None]
+            ids = [vid for vid, d in zip(base_ids, deleted) if not d]
+            ids += [vid for vid, _ in live]
+            mats = [np.asarray(base[keep])]
+            if live:
+                mats.append(np.stack([v for _, v in live]))
+            mat = np.ascontiguousarray(np.concatenate(mats), dtype=np.float32)
+
+            if len(mat) < self.IVF_MIN_ROWS:
+                centroids = offsets = None
+                trained_rows = 0
+            else:
+                if centroids is not None and len(mat) < 2 * trained_rows:
+                    # 기존 행은 리스트 유지, 새 행만 배정
+                    base_labels = np.repeat(
+                        np.arange(len(centroids), dtype=np.int32), np.diff(offsets))
+                    new_labels = _assign(mats[1], centroids) if live else np.zeros(0, np.int32)
+                    labels = np.concatenate([base_labels[keep], new_labels])
+                else:
+                    nlist = int(np.sqrt(len(mat)))
+                    sample = mat[np.random.default_rng(0).choice(
+                        len(mat), min(len(mat), nlist * 40), replace=False)]
+                    centroids = _kmeans(sample, nlist)
+                    labels = _assign(mat, centroids)
+                    trained_rows = len(mat)
+                order = np.argsort(labels, kind="stable")
+                mat = mat[order]
+                ids = [ids[i] for i in order]
+                offsets = np.concatenate(
+                    [[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]).astype(np.int64)
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_npy = self.path + ".tmp.npy"
+            tmp_ids = self._ids_path + ".tmp"
+            tmp_ivf = self.path + ".tmp.ivf.npz"
+            np.save(tmp_npy, mat)
+            with open(tmp_ids, "w", encoding="utf-8") as f:
+                json.dump(ids, f)
+            if centroids is not None:
+                np.savez(tmp_ivf, centroids=centroids, offsets=offsets,
+                         trained_rows=trained_rows)
+                os.replace(tmp_ivf, self._ivf_path)
+            elif os.path.exists(self._ivf_path):
+                os.remove(self._ivf_path)
+            os.replace(tmp_ids, self._ids_path)
+            os.replace(tmp_npy, self._npy)
+            # 동기화 위치는 마지막에 기록 (중간에 죽으면 예전 위치부터 다시 읽을 뿐)
+            if synced is not None:
+                tmp_sync = self._sync_path + ".tmp"
+                with open(tmp_sync, "w", encoding="utf-8") as f:
+                    json.dump({"updated_at": synced[0].isoformat(), "id": synced[1]}, f)
+                os.replace(tmp_sync, self._sync_path)
+            elif os.path.exists(self._sync_path):
+                os.remove(self._sync_path)
+
+            with self._lock:
+                pending = self._delta[len(delta):]
+                self._set_base(np.load(self._npy, mmap_mode="r"), ids,
+                               centroids, offsets, trained_rows)
+                self._saved_synced = synced
+                for entry in pending:
+                    if entry is not None:
+                        self._put(*entry)
+        logging.info(f"[song-vectors] saved {len(ids)} vectors")
+
+    def load_from_db(self, get_db_connection, batch_size=5000):
+        """analyzed_songs.feature_vector 로 인덱스 재구성"""
+        last_id = 0
+        count = 0
+        with get_db_connection() as connection:
+            cursor = connection.cursor()
+            # 읽는 도중 갱신된 행은 이후 동기화에서 다시 반영되도록 시작 시각을 기록
+            cursor.execute("SELECT NOW()")
+            started_at = cursor.fetchone()[0]
+            while True:
+                cursor.execute(
+                    "SELECT id, video_id, feature_vector FROM analyzed_songs "
+                    "WHERE id > %s AND feature_vector IS NOT NULL ORDER BY id LIMIT %s",
+                    (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for row_id, video_id, blob in rows:
+                    last_id = row_id
+                    vec = np.frombuffer(bytes(blob), dtype=np.float32)
+                    if vec.size == self.dim:
+                        with self._lock:
+                            self._put(video_id, vec)
+                        count += 1
+            cursor.close()
+        self.mark_synced(started_at, 0)
+        self.save()
+        logging.info(f"[song-vectors] rebuilt {count} vectors from DB")
+        return count
+
+    def register_atexit(self):
+        atexit.register(self.save)
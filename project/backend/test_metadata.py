@@ -0,0 +1,117 @@
+# test_metadata.py
+"""MetadataService 요청 합치기 / 50개 배치 / 없는 영상 캐시 회귀 테스트 (upstream 은 가짜 클라이언트)
+
+    python -m pytest test_metadata.py
+"""
+import time
+import threading
+import metadata
+from metadata import MetadataService
+
+
+class FakeClient:
+    """YouTubeDataClient 대신 — 호출을 기록하고, release 전까지 응답을 붙잡아 둘 수 있음"""
+
+    def __init__(self, missing=(), hold=False):
+        self.missing = set(missing)
+        self.search_calls = []
+        self.video_calls = []
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+        self._lock = threading.Lock()
+
+    def search(self, query, page_token="", max_results=10):
+        with self._lock:
+            self.search_calls.append((query, page_token))
+        self.release.wait(5)
+        return {"items": [{"id": {"videoId": f"{query[:3]}{i:08d}"},
+                           "snippet": {"title": f"{query} {i}", "channelTitle": "ch"}}
+                          for i in range(3)],
+                "nextPageToken": "next"}
+
+    def videos(self, video_ids):
+        with self._lock:
+            self.video_calls.append(list(video_ids))
+        self.release.wait(5)
+        return {"items": [{"id": vid, "snippet": {"title": f"title {vid}"}}
+                          for vid in video_ids if vid not in self.missing]}
+
+
+def wait_for(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def run_threads(target, args_list):
+    results = [None] * len(args_list)
+
+    def run(i, args):
+        results[i] = target(*args)
+
+    threads = [threading.Thread(target=run, args=(i, args))
+               for i, args in enumerate(args_list)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_searches_coalesce():
+    client = FakeClient(hold=True)
+    service = MetadataService(client)
+    threads, results = run_threads(service.search, [("lofi",)] * 5)
+    # 5개가 모두 들어와(1개 upstream + 4개 대기) 있을 때 upstream 응답을 풀어 줌
+    assert wait_for(lambda: service.stats()["search_coalesced"] == 4)
+    client.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(client.search_calls) == 1
+    assert all(r == results[0] for r in results)
+    assert len(results[0]["items"]) == 3
+    # 다시 물어도 캐시에서 (공백/대소문자 차이 포함)
+    service.search("  LOFI ")
+    assert len(client.search_calls) == 1
+
+
+def test_search_results_seed_video_cache():
+    client = FakeClient()
+    service = MetadataService(client)
+    items = service.search("jazz")["items"]
+    found = service.get_videos([song["videoId"] for song in items])
+    assert set(found) == {song["videoId"] for song in items}
+    assert client.video_calls == []
+
+
+def test_concurrent_video_lookups_batch_by_50(monkeypatch):
+    # 스레드 시작이 늦어도 같은 창 안에 들어오도록 배치 창을 넉넉히
+    monkeypatch.setattr(metadata, "BATCH_WINDOW", 0.3)
+    client = FakeClient()
+    service = MetadataService(client)
+    ids = [f"vid{i:08d}" for i in range(120)]
+    threads, results = run_threads(
+        service.get_videos, [(ids[i:i + 30],) for i in range(0, 120, 30)])
+    for t in threads:
+        t.join(5)
+
+    assert sorted(len(call) for call in client.video_calls) == [20, 50, 50]
+    assert sum(len(r) for r in results) == 120
+    stats = service.stats()
+    assert stats["video_upstream_calls"] == 3
+    assert stats["video_upstream_ids"] == 120
+    # 캐시된 뒤에는 upstream 호출 없음
+    service.get_videos(ids)
+    assert len(client.video_calls) == 3
+
+
+def test_missing_video_is_cached():
+    client = FakeClient(missing={"gone0000000"})
+    service = MetadataService(client)
+    assert service.get_video("gone0000000") is None
+    assert service.get_video("gone0000000") is None
+    assert client.video_calls == [["gone0000000"]]
+    assert service.stats()["video_missing_hits"] == 1
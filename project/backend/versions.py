@@ -0,0 +1,10 @@
+# versions.py
+"""
+분석 결과 버전 — API 서버가 오디오 스택(librosa 등)을 올리지 않고도 참조할 수 있게 분리.
+
+PIPELINE_VERSION: 디코딩 값(템플릿, 평활화, Viterbi, 병합)을 바꾸면 올린다.
+  → analyzed_songs 의 예전 버전 행은 reanalyze.py 가 백그라운드로 다시 분석
+FEATURE_VERSION: 특징 추출 단계(HPSS, 비트, 크로마)를 바꾸면 올린다 (특징 캐시 무효화)
+"""
+PIPELINE_VERSION = 1
+FEATURE_VERSION = 1
@@ -0,0 +1,134 @@
+# worker.py
+"""
+분석 워커 — analysis_jobs 테이블에서 작업을 가져와 다운로드 + 코드 분석 후 결과 저장.
+상태가 없으므로 여러 노드/프로세스에서 같은 MySQL 을 보고 몇 개든 띄울 수 있다.
+
+    python worker.py                 # 프로세스 1개
+    python worker.py --processes 4   # 한 노드에서 4개
+"""
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+sys.path.append(os.path.join(os.path.dirname(__file__), 'db'))
+import jobs
+from songs import save_analysis_to_db
+from analysis import (download_audio_from_youtube, analyze_audio_for_chords,
+                      warm_up, PIPELINE_VERSION)
+
+logging.basicConfig(level=logging.INFO,
+                    format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+
+OUTPUT_DIR = "downloads"
+POLL_INTERVAL = 1.0        # 작업이 없을 때 대기(초)
+EXPIRE_EVERY = 30          # 죽은 작업 정리 주기(초)
+PURGE_EVERY = 600          # 끝난 작업 삭제 주기(초)
+
+
+class Heartbeat(threading.Thread):
+    """작업 중 임대를 주기적으로 연장. 임대를 잃으면 lost 로 표시"""
+
+    def __init__(self, job_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.lease_seconds / 3):
+            try:
+                if not jobs.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    self.lost = True
+                    return
+            except Exception as e:
+                logging.warning(f"[worker] heartbeat failed: {e}")
+
+    def stop(self):
+        self._done.set()
+
+
+def process_job(job, worker_id, lease_seconds):
+    video_id = job["video_id"]
+    logging.info(f"[worker] job {job['id']} ({video_id}) attempt {job['attempt']}")
+    hb = Heartbeat(job["id"], worker_id, lease_seconds)
+    hb.start()
+    try:
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        audio_path = download_audio_from_youtube(video_url, OUTPUT_DIR)
+        result, features = analyze_audio_for_chords(
+            audio_path, with_features=True, cache_key=video_id)
+        if hb.lost:
+            logging.warning(f"[worker] job {job['id']} lease lost, dropping result")
+            return
+        if not save_analysis_to_db(video_id, result, audio_path, features, PIPELINE_VERSION):
+            # 저장 실패는 done 으로 넘기지 않고 재시도 경로로
+            jobs.fail_job(job["id"], worker_id, "failed to save analysis to DB")
+            return
+        jobs.complete_job(job["id"], worker_id, result)
+    except Exception as e:
+        logging.exception(f"[worker] job {job['id']} failed")
+        jobs.fail_job(job["id"], worker_id, e)
+    finally:
+        hb.stop()
+
+
+def run_worker(lease_seconds=jobs.LEASE_SECONDS, retention_seconds=jobs.JOB_RETENTION_SECONDS):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    try:
+        # 첫 작업이 JIT 컴파일 비용을 떠안지 않도록 작업을 받기 전에 예열
+        logging.info(f"[worker] warm-up done in {warm_up():.2f}s")
+    except Exception as e:
+        logging.warning(f"[worker] warm-up failed: {e}")
+    logging.info(f"[worker] {worker_id} started")
+    last_expire = last_purge = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_expire > EXPIRE_EVERY:
+                jobs.expire_dead_jobs()
+                last_expire = time.monotonic()
+            if time.monotonic() - last_purge > PURGE_EVERY:
+                last_purge = time.monotonic()
+                purged = jobs.purge_finished_jobs(retention_seconds)
+                if purged:
+                    logging.info(f"[worker] purged {purged} finished jobs")
+            job = jobs.claim_job(worker_id, lease_seconds)
+        except Exception as e:
+            logging.warning(f"[worker] claim failed: {e}")
+            job = None
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        process_job(job, worker_id, lease_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AutoChord 분석 워커")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="이 노드에서 띄울 워커 프로세스 수")
+    parser.add_argument("--lease", type=int, default=jobs.LEASE_SECONDS,
+                        help="작업 임대 시간(초)")
+    parser.add_argument("--retention", type=int, default=jobs.JOB_RETENTION_SECONDS,
+                        help="끝난 작업을 남겨 두는 시간(초)")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.lease, args.retention)
+        return
+    procs = [multiprocessing.Process(target=run_worker, args=(args.lease, args.retention),
+                                     name=f"worker-{i}")
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
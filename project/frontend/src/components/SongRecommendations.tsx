@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Song } from '../types/song';
-import { searchSongs } from '../utils/api';
+import { getRecommendations, searchSongs } from '../utils/api';
 
 interface SongRecommendationsProps {
   currentSong: {
@@ -24,6 +24,17 @@ const SongRecommendations: React.FC<SongRecommendationsProps> = ({
     const loadRecommendations = async () => {
       try {
         setLoading(true);
+
+        // 분석된 곡이면 코드 진행/음색이 비슷한 곡을 먼저 사용
+        try {
+          const similar = await getRecommendations(currentSong.videoId, 6);
+          if (similar.length > 0) {
+            setRecommendations(similar);
+            return;
+          }
+        } catch (error) {
+          // 아직 분석되지 않은 곡 → 검색 기반 추천으로 대체
+        }
         
         // 현재 곡의 아티스트나 제목을 기반으로 관련 곡 검색
         const searchQueries = [
@@ -3,8 +3,6 @@ import { createRoot } from 'react-dom/client';
 import App from './App.tsx';
 import './index.css';
 
-console.log('▶ Loaded YT Key:', import.meta.env.VITE_YOUTUBE_API_KEY);
-
 createRoot(document.getElementById('root')!).render(
   <StrictMode>
     <App />
@@ -4,7 +4,7 @@ import { ChevronUp, ChevronDown } from 'lucide-react';
 import SearchBar from '../components/SearchBar';
 import SongCard from '../components/SongCard';
 import LoginButton from '../components/LoginButton';
-import { searchSongs } from '../utils/api';
+import { prefetchSongs, searchSongs } from '../utils/api';
 import { Song } from '../types/song';
 
 const SearchPage: React.FC = () => {
@@ -27,6 +27,8 @@ const SearchPage: React.FC = () => {
         setSongs(prev => (append ? [...prev, ...items] : items));
         setNextPageToken(token || '');
         setHasMore(!!token);
+        // 클릭할 가능성이 있는 곡들을 서버가 미리 분석해 두도록 요청
+        prefetchSongs(items.map(item => item.videoId)).catch(() => {});
       } catch (error) {
         console.error('Error loading songs:', error);
       } finally {
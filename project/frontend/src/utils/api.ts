@@ -17,11 +17,10 @@ export interface SongDetail {
   // 필요에 따라 contentDetails 등 추가 정의 가능
 }
 
-const API_KEY = import.meta.env.VITE_YOUTUBE_API_KEY;
 const SERVER_URL = import.meta.env.VITE_API_SERVER_URL;
 
 /**
- * 유튜브에서 영상 리스트 검색
+ * 유튜브에서 영상 리스트 검색 (서버에서 캐시)
  * @param query 검색어
  * @param pageToken 다음 페이지 토큰 (optional)
  */
@@ -29,62 +28,27 @@ export const searchSongs = async (
   query: string,
   pageToken = ''
 ): Promise<{ items: Song[]; nextPageToken?: string }> => {
-  const maxResults = 10;
-  // URLSearchParams로 파라미터 구성
-  const params = new URLSearchParams({
-    part: 'snippet',
-    type: 'video',
-    maxResults: String(maxResults),
-    q: query,
-    key: API_KEY
-  });
+  const params = new URLSearchParams({ q: query });
   // pageToken이 있을 때만 추가
   if (pageToken) {
     params.append('pageToken', pageToken);
   }
-  const url = `https://www.googleapis.com/youtube/v3/search?${params.toString()}`;
-  console.log('▶️ YouTube 검색 URL:', url);
-
-  const res = await fetch(url);
+  const res = await fetch(`${SERVER_URL}/search?${params.toString()}`);
   if (!res.ok) throw new Error(`YouTube Search Error: ${res.status}`);
   const data = await res.json();
-
-  const items: Song[] = data.items.map((it: any) => ({
-    videoId: it.id.videoId,
-    title: it.snippet.title,
-    channelTitle: it.snippet.channelTitle,
-    thumbnailUrl: it.snippet.thumbnails.high.url
-  }));
-
-  return { items, nextPageToken: data.nextPageToken };
+  return { items: data.items, nextPageToken: data.nextPageToken ?? undefined };
 };
 
 /**
- * 단일 영상의 메타데이터 조회
+ * 단일 영상의 메타데이터 조회 (서버에서 캐시 + 여러 요청을 묶어서 조회)
  * @param videoId 유튜브 동영상 ID
  */
 export const getSongDetail = async (
   videoId: string
 ): Promise<SongDetail> => {
-  const url = `https://www.googleapis.com/youtube/v3/videos?` +
-    new URLSearchParams({
-      part: 'snippet,contentDetails',
-      id: videoId,
-      key: API_KEY
-    }).toString();
-
-  const res = await fetch(url);
+  const res = await fetch(`${SERVER_URL}/videos/${encodeURIComponent(videoId)}`);
   if (!res.ok) throw new Error(`YouTube Detail Error: ${res.status}`);
-  const data = await res.json();
-  const vid = data.items[0];
-
-  return {
-    videoId,
-    title: vid.snippet.title,
-    channelTitle: vid.snippet.channelTitle,
-    thumbnailUrl: vid.snippet.thumbnails.high.url,
-    // contentDetails 등 추가 정보가 필요하면 여기에 할당
-  };
+  return await res.json();
 };
 
 /**
@@ -120,4 +84,52 @@ export const analyzeSong = async (videoId: string) => {
 
   if (!res.ok) throw new Error('분석 실패');
   return await res.json();
-};
\ No newline at end of file
+};
+/**
+ * 코드 진행으로 분석된 곡 검색
+ * @param progression "I-V-vi-IV"(모든 키) 또는 "Em-C-G-D"(해당 키)
+ * @param key 곡 키 필터 (optional)
+ */
+export const searchByChords = async (
+  progression: string,
+  key = ''
+): Promise<{ videoId: string; key: string | null; timestamps: number[] }[]> => {
+  const params = new URLSearchParams({ q: progression });
+  if (key) {
+    params.append('key', key);
+  }
+  const res = await fetch(`${SERVER_URL}/chords/search?${params.toString()}`);
+  if (!res.ok) throw new Error('코드 진행 검색 실패');
+  const data = await res.json();
+  return data.results;
+};
+
+/**
+ * 코드 진행/음색이 비슷한 분석된 곡 추천
+ * @param videoId 기준 곡 ID
+ * @param k 추천 개수
+ */
+export const getRecommendations = async (
+  videoId: string,
+  k = 10
+): Promise<(Song & { score: number })[]> => {
+  const res = await fetch(
+    `${SERVER_URL}/recommendations/${encodeURIComponent(videoId)}?k=${k}`
+  );
+  if (!res.ok) throw new Error('추천 곡 조회 실패');
+  const data = await res.json();
+  return data.items;
+};
+
+/**
+ * 검색 결과 곡들을 서버에서 미리 분석하도록 요청 (남는 자원으로만 실행)
+ * @param videoIds 검색 결과 영상 ID 목록
+ */
+export const prefetchSongs = async (videoIds: string[]): Promise<void> => {
+  if (videoIds.length === 0) return;
+  await fetch(`${SERVER_URL}/prefetch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ videoIds }),
+  });
+};